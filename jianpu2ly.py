@@ -98,19 +98,32 @@ import re
 import shutil
 import tempfile
 import argparse
-import requests
+import functools
+import itertools
+import locale
 import subprocess
-import six
 
 from fractions import Fraction as F
 from string import ascii_letters as letters
-from subprocess import getoutput
 
 # Control options
 bar_number_every = 0
+# Environment options, read once at import time
+_STAFF_SIZE = float(os.environ.get("j2ly_staff_size", 20))
+_SLOPPY_BARS = bool(os.environ.get("j2ly_sloppy_bars", ""))
 midiInstrument = "choir aahs"  # see  https://lilypond.org/doc/v2.24/Documentation/notation/midi-instruments
 padding = 3
 
+# Precompiled regexes for paths that may be hit repeatedly
+_LILY_VER_RE = re.compile(r".*ond-2\.([1-9][0-9])\.")
+_ASCII_LINE_RE = re.compile(r"[ -~]*$")
+
+
+@functools.lru_cache(maxsize=1024)
+def _word_boundary_re(word):
+    """Returns a compiled regex matching 'word' on whitespace boundaries."""
+    return re.compile(r"(\s|^)" + re.escape(word) + r"(?=\s|$)")
+
 
 def as_unicode(input_string):
     """
@@ -122,9 +135,9 @@ def as_unicode(input_string):
     Returns:
         The input in Unicode format.
     """
-    if isinstance(input_string, six.text_type):
+    if isinstance(input_string, str):
         return input_string
-    elif isinstance(input_string, six.binary_type):
+    elif isinstance(input_string, (bytes, bytearray)):
         return input_string.decode("utf-8")
     else:
         raise TypeError(f"Expected unicode or bytes, got {input_string}")
@@ -143,12 +156,16 @@ def lilypond_minor_version():
         pass
     cmd = lilypond_command()
     if cmd:
-        m = re.match(r".*ond-2\.([1-9][0-9])\.", cmd)
+        m = _LILY_VER_RE.match(cmd)
         if m:
             _lilypond_minor_version = int(m.group(1))
         else:
             _lilypond_minor_version = int(
-                getoutput(cmd + " --version").split()[2].split(".")[1]
+                subprocess.run(
+                    [cmd, "--version"], capture_output=True, text=True, check=False
+                )
+                .stdout.split()[2]
+                .split(".")[1]
             )
     else:
         _lilypond_minor_version = 20  # 2.20
@@ -159,6 +176,20 @@ def lilypond_command():
     """
     Returns the path to the LilyPond executable if it is installed on the system.
     If LilyPond is not found, returns None.
+    The result is cached so repeated calls avoid re-probing the filesystem.
+    """
+    global _lilypond_command
+    try:
+        return _lilypond_command
+    except NameError:
+        pass
+    _lilypond_command = _find_lilypond_command()
+    return _lilypond_command
+
+
+def _find_lilypond_command():
+    """
+    Probes the filesystem for a LilyPond executable (see lilypond_command).
     """
     w = shutil.which("lilypond")
     if w:
@@ -182,42 +213,43 @@ def lilypond_command():
     return None
 
 
-def all_scores_start(poet1st, hasarranger):
+# Poet/composer header markup for all_scores_start (order depends on which
+# should appear first)
+_HDR_POET_FIRST = (
+    r"\right-align \fromproperty #'header:poet"
+    "\n"
+    r"\right-align \fromproperty #'header:composer"
+    "\n"
+)
+_HDR_COMP_FIRST = (
+    r"\right-align \fromproperty #'header:composer"
+    "\n"
+    r"\right-align \fromproperty #'header:poet"
+    "\n"
+)
+
+
+def all_scores_start(poet1st):
     """
     Returns a string containing the Lilypond code for setting up the score.
     The code includes settings for staff size, paper size, margins, fonts, and spacing.
     :param poet1st: bool, if True, 'header:poet' appears before 'header:composer', otherwise the order is reversed.
     :return: str
     """
-    staff_size = float(os.environ.get("j2ly_staff_size", 20))
+    staff_size = _STAFF_SIZE
     # Normal: j2ly_staff_size=20
     # Large: j2ly_staff_size=25.2
     # Small: j2ly_staff_size=17.82
     # Tiny: j2ly_staff_size=15.87
-    r = (
+    parts = [
         fr"""\version "2.18.0"
 #(set-global-staff-size {staff_size})"""
-    )
+    ]
 
     # Modify the headers section based on poet1st argument
-    headers_poet_composer = (
-        (
-            r"\right-align \fromproperty #'header:poet"
-            "\n"
-            r"\right-align \fromproperty #'header:composer"
-            "\n"
-        )
-        if poet1st
-        else (
-            r"\right-align \fromproperty #'header:composer"
-            "\n"
-            r"\right-align \fromproperty #'header:poet"
-            "\n"
-        )
-    )
+    headers_poet_composer = _HDR_POET_FIRST if poet1st else _HDR_COMP_FIRST
 
-    nullrow = "\n" if hasarranger else "\n"
-    r += (
+    parts.append(
         r"""
 
 % comment out the next line to have Lilypond tagline:
@@ -248,7 +280,7 @@ def all_scores_start(poet1st, hasarranger):
       }
       \dir-column {
           """
-        + nullrow
+        + "\n"
         + headers_poet_composer
         + r"""
           \right-align \fromproperty #'header:arranger
@@ -269,27 +301,27 @@ def all_scores_start(poet1st, hasarranger):
     # and Noto Sans CJK SC (regular and bold) from https://fonts.google.com/
     # On Ubuntu, the fonts can be installed by running `apt install fonts-noto-cjk`
     if lilypond_minor_version() >= 20:
-        r += r"""
+        parts.append(r"""
   #(define fonts
     (set-global-fonts
      #:roman "Noto Serif CJK SC,Noto Serif SC,Times New Roman"
      #:sans "Noto Sans CJK SC,Noto Sans SC,Arial Unicode MS"
      #:factor (/ staff-height pt 20)
     ))
-"""
+""")
 
     if has_lyrics:
         global padding
-        r += rf"""
+        parts.append(rf"""
   % Might need to enforce a minimum spacing between systems, especially if lyrics are
   % below the last staff in a system and numbers are on the top of the next
   system-system-spacing = #'((basic-distance . 7) (padding . {padding}) (stretchability . 1e7))
   score-markup-spacing = #'((basic-distance . 9) (padding . {padding}) (stretchability . 1e7))
   score-system-spacing = #'((basic-distance . 9) (padding . {padding}) (stretchability . 1e7))
   markup-system-spacing = #'((basic-distance . 2) (padding . 2) (stretchability . 0))
-"""
-    r += "}\n"  # end of \paper block
-    return r
+""")
+    parts.append("}\n")  # end of \paper block
+    return "".join(parts)
 
 
 def score_start():
@@ -302,15 +334,15 @@ def score_start():
     Returns:
         str: The starting string for a LilyPond score.
     """
-    ret = "\\score {\n"
+    parts = ["\\score {\n"]
     if midi:
-        ret += "\\unfoldRepeats\n"
-    ret += r"<< "
+        parts.append("\\unfoldRepeats\n")
+    parts.append(r"<< ")
     if bar_number_every and not notehead_markup.noBarNums and not midi:
-        ret += (
+        parts.append(
             f"\\override Score.BarNumber #'break-visibility = #end-of-line-invisible\n\\set Score.barNumberVisibility = #(every-nth-bar-number-visible {bar_number_every})"
         )
-    return ret
+    return "".join(parts)
 
 
 def score_end(**headers):
@@ -323,33 +355,43 @@ def score_end(**headers):
     Returns:
         A string representing the end of a music score.
     """
-    ret = ">>\n"
+    parts = [">>\n"]
     if headers:
         # since about Lilypond 2.7, music must come
         # before the header block if it's per-score
-        ret += r"\header{" + "\n"
-        for k, v in headers.items():
-            if '"' not in v and r"\markup" not in v:
-                v = '"' + v + '"'
-            ret += k + "=" + v + "\n"
-        # Placeholder for key and time signatures
-        ret += r'keytimesignature=""' + "\n"
-        ret += "}\n"
+        # (the keytimesignature line is a placeholder filled in later)
+        dq, mk = '"', r"\markup"
+        parts.append(
+            r"\header{"
+            + "\n"
+            + "".join(
+                f"{k}={v if dq in v or mk in v else dq + v + dq}\n"
+                for k, v in headers.items()
+            )
+            + 'keytimesignature=""\n}\n'
+        )
 
     if midi:
         # will be overridden by any \tempo command used later
-        ret += (
+        parts.append(
             r'\midi { \context { \Score midiInstrument = "'
             + midiInstrument
             + r'" tempoWholesPerMinute = #(ly:make-moment 84 4)}}'
         )
-        # ret += r'\midi { \context { \Score tempoWholesPerMinute = #(ly:make-moment 84 4)}}'
+        # parts.append(r'\midi { \context { \Score tempoWholesPerMinute = #(ly:make-moment 84 4)}}')
     elif notehead_markup.noBarNums:
-        ret += r'\layout { indent = 0.0 \context { \Score \remove "Bar_number_engraver" } }'
+        parts.append(r'\layout { indent = 0.0 \context { \Score \remove "Bar_number_engraver" } }')
     else:
-        # ret += r"\layout{}"
-        ret += r"\layout { indent = 0.0 \context { \Score \override TimeSignature.break-visibility = #'#(#f #t #t) } }"
-    return ret + " }"
+        # parts.append(r"\layout{}")
+        parts.append(r"\layout { indent = 0.0 \context { \Score \override TimeSignature.break-visibility = #'#(#f #t #t) } }")
+    parts.append(" }")
+    return "".join(parts)
+
+
+# Translation table mapping digits to letters so generated voice names are
+# valid LilyPond identifiers (precomputed once; same mapping as indexing
+# (letters * 5)[:256] by code point)
+_UNIQ_TRANS = str.maketrans({d: (letters * 5)[ord(d)] for d in "0123456789"})
 
 
 def unique_name():
@@ -360,7 +402,35 @@ def unique_name():
     global uniqCount
     r = str(uniqCount)
     uniqCount += 1
-    return r.translate((letters * 5)[:256])
+    return r.translate(_UNIQ_TRANS)
+
+
+# Static override blocks for jianpu_voice_start, hoisted so every voice
+# reuses the same interned literals
+_JIANPU_VOICE_HEAD = r"""
+    #(set-accidental-style 'neo-modern) % Allow repeating accidentals within a measure
+    \override Beam #'transparent = ##f
+    """
+_JIANPU_VOICE_NOT_ANGKA_BLOCK = r"""
+        \override Stem #'direction = #UP
+        \override Tie #'staff-position = #-2.5
+        \tupletDown
+        """
+_JIANPU_VOICE_NORMAL_BLOCK = r"""
+        \override Stem #'direction = #DOWN
+        \override Tie #'staff-position = #2.5
+        \override Beam.positions = #'(-1 . -1)
+        \tupletUp
+        """
+_JIANPU_VOICE_TAIL = r"""
+    \override Beam #'beam-thickness = #0.1
+    \override Beam #'length-fraction = #-0.5
+    \override Voice.Rest #'style = #'neomensural
+    \override Accidental #'font-size = #-4
+    \override TupletBracket #'bracket-visibility = ##t
+    \set Voice.chordChanges = ##t %% 2.19 bug workaround
+    \override BreathingSign.text = \markup { \fontsize #-4 \musicglyph #"scripts.upbow" }
+    """
 
 
 def jianpu_voice_start(isTemp=0):
@@ -391,39 +461,19 @@ def jianpu_voice_start(isTemp=0):
 
     stemLenFrac = "0.5" if not isTemp and maxBeams >= 2 else "0"
     voiceName = unique_name()
-    r = f"""\\new Voice="{voiceName}" {{\n"""
-    r += r"""
-    #(set-accidental-style 'neo-modern) % Allow repeating accidentals within a measure
-    \override Beam #'transparent = ##f
-    """
+    parts = [f"""\\new Voice="{voiceName}" {{\n""", _JIANPU_VOICE_HEAD]
 
     if not_angka:
-        r += r"""
-        \override Stem #'direction = #UP
-        \override Tie #'staff-position = #-2.5
-        \tupletDown
-        """
+        parts.append(_JIANPU_VOICE_NOT_ANGKA_BLOCK)
         stemLenFrac = str(0.4 + 0.2 * max(0, maxBeams - 1))
     else:
-        r += r"""
-        \override Stem #'direction = #DOWN
-        \override Tie #'staff-position = #2.5
-        \override Beam.positions = #'(-1 . -1)
-        \tupletUp
-        """
+        parts.append(_JIANPU_VOICE_NORMAL_BLOCK)
 
-    r += rf"""
-    \override Stem #'length-fraction = #{stemLenFrac}
-    \override Beam #'beam-thickness = #0.1
-    \override Beam #'length-fraction = #-0.5
-    \override Voice.Rest #'style = #'neomensural
-    \override Accidental #'font-size = #-4
-    \override TupletBracket #'bracket-visibility = ##t
-    \set Voice.chordChanges = ##t %% 2.19 bug workaround
-    \override BreathingSign.text = \markup {{ \fontsize #-4 \musicglyph #"scripts.upbow" }}
-    """
+    parts.append("\n    \\override Stem #'length-fraction = #" + stemLenFrac)
+    parts.append(_JIANPU_VOICE_TAIL)
+    parts.append("\n")
 
-    return r + "\n", voiceName
+    return "".join(parts), voiceName
 
 
 def jianpu_staff_start(inst=None, withStaff=False):
@@ -452,45 +502,52 @@ def jianpu_staff_start(inst=None, withStaff=False):
     """
 
     # Adding comments for ease of copy/pasting into other files
-    r = (
+    parts = [
         "\n%% === BEGIN NOT ANGKA STAFF ===\n"
         if not_angka
         else "\n%% === BEGIN JIANPU STAFF ===\n"
-    )
-    r += r"\new RhythmicStaff \with {"
-    r += '\n    \\consists "Accidental_engraver"' if not not_angka else ""
+    ]
+    parts.append(r"\new RhythmicStaff \with {")
+    if not not_angka:
+        parts.append('\n    \\consists "Accidental_engraver"')
 
     # Adding instrument name if provided
     if inst:
-        r += '\n    instrumentName = "' + inst + '"'
-        r += '\n    shortInstrumentName = "' + inst + '"'
+        parts.append('\n    instrumentName = "' + inst + '"')
+        parts.append('\n    shortInstrumentName = "' + inst + '"')
 
     # Adjusting spacing for an associated Western staff
     if withStaff:
-        r += r"""
+        parts.append(
+            r"""
     %% Limit space between Jianpu and corresponding-Western staff
     \override VerticalAxisGroup.staff-staff-spacing = #'((minimum-distance . 7) (basic-distance . 7) (stretchability . 0))
     """
+        )
 
     # Overrides for the appearance of the staff and bar lines
-    r += r"""
+    parts.append(
+        r"""
     %% Get rid of the stave but not the barlines:
     \override StaffSymbol #'line-count = #0
     \override BarLine #'bar-extent = #'(-2 . 2)
     }
     { """
+    )
 
     # Initialize Jianpu voice settings
     j, voiceName = jianpu_voice_start()
-    r += j
-    r += r"""
+    parts.append(j)
+    parts.append(
+        r"""
     \override Staff.TimeSignature #'style = #'numbered
     \override Staff.TimeSignature.stencil = #ly:text-interface::print
     \once \omit Staff.TimeSignature
     \override Staff.Stem #'transparent = ##t
     """
+    )
 
-    return r, voiceName
+    return "".join(parts), voiceName
 
 
 def jianpu_staff_end():
@@ -561,24 +618,25 @@ def western_staff_start(inst=None):
     configured for Western notation. It includes various overrides for appearance
     and an optional instrument name.
     """
-    r = r"""
+    parts = [
+        r"""
 %% === BEGIN 5-LINE STAFF ===
     \new Staff """
+    ]
     if inst:
-        r += r'\with { instrumentName = "' + inst + '" } '
+        parts.append(r'\with { instrumentName = "' + inst + '" } ')
     voiceName = unique_name()
-    return (
-        r
-        + r"""{
+    parts.append(
+        r"""{
     \override Score.SystemStartBar.collapse-height = #11 %% (needed on 2.22)
     \new Voice="%s" {
     #(set-accidental-style 'modern-cautionary)
     \override Staff.TimeSignature #'style = #'numbered
     \set Voice.chordChanges = ##f %% for 2.19.82 bug workaround
 """
-        % voiceName,
-        voiceName,
+        % voiceName
     )
+    return "".join(parts), voiceName
 
 
 def western_staff_end():
@@ -701,47 +759,53 @@ def highlight_word_in_line(word, line):
     """
     if "xterm" in os.environ.get("TERM", ""):
         # Use xterm underline escapes
-        return re.sub(
-            r"(\s|^)" + re.escape(word) + r"(?=\s|$)",
+        return _word_boundary_re(word).sub(
             lambda m: m.group(1) + "\x1b[4m" + word + "\x1b[m",
             line,
         )
-    elif re.match("[ -~]*$", line):
-        # All ASCII: underline the word with '^'
-        underline = re.sub(
-            "[^^]",
-            " ",
-            re.sub(
-                r"(\s|^)" + re.escape(word) + r"(?=\s|$)",
-                lambda m: m.group(1) + "^" * len(word),
-                line,
-            ),
-        )
-        return line + "\n" + underline
+    elif _ASCII_LINE_RE.match(line):
+        # All ASCII: underline each occurrence of the word with '^'
+        underline = [" "] * len(line)
+        wlen = len(word)
+        idx = line.find(word)
+        while idx >= 0:
+            if (idx == 0 or line[idx - 1].isspace()) and (
+                idx + wlen == len(line) or line[idx + wlen].isspace()
+            ):
+                underline[idx : idx + wlen] = "^" * wlen
+            idx = line.find(word, idx + 1)
+        return line + "\n" + "".join(underline)
     else:
         # Default: no special handling for non-ASCII or unsupported terminals
         return line
 
 
-placeholders = {
-    # for accidentals and word-fitting to work
-    # (we make them relative to the actual key later
-    # so that MIDI pitches are correct)
-    "0": "r",
-    "1": "c",
-    "2": "d",
-    "3": "e",
-    "4": "f",
-    "5": "g",
-    "6": "a",
-    "7": "b",
-    "-": "r",
-}
-
-
+# Placeholder notes for accidentals and word-fitting to work
+# (we make them relative to the actual key later
+# so that MIDI pitches are correct).  Stored as a 256-entry lookup
+# table indexed by ord(ch); 0 means "no placeholder for this char".
+_PH_LUT = bytearray(256)
+for _ch, _ph in [
+    ("0", "r"),
+    ("1", "c"),
+    ("2", "d"),
+    ("3", "e"),
+    ("4", "f"),
+    ("5", "g"),
+    ("6", "a"),
+    ("7", "b"),
+    ("-", "r"),
+]:
+    _PH_LUT[ord(_ch)] = ord(_ph)
+del _ch, _ph
+
+
+@functools.lru_cache(maxsize=64)
 def addOctaves(octave1, octave2):
     """
-    Given two octave strings, returns the resulting octave string after adding them together.
+    Given two octave strings, returns the resulting octave string after
+    adding them together.  Cached: the argument domain is a handful of
+    short mark strings, so repeat calls are a C-level lookup.
 
     Args:
         octave1 (str): The first octave string.
@@ -750,21 +814,75 @@ def addOctaves(octave1, octave2):
     Returns:
         str: The resulting octave string after adding octave1 and octave2 together.
     """
-    # so it can be used with a base-octave change
-    octave2 = octave2.replace(">", "'").replace("<", ",")
-    while octave1:
-        if octave1[0] in "'>":  # go up
-            if "," in octave2:
-                octave2 = octave2[:-1]
-            else:
-                octave2 += "'"
-        else:  # , or < : go down
-            if "'" in octave2:
-                octave2 = octave2[:-1]
-            else:
-                octave2 += ","
-        octave1 = octave1[1:]
-    return octave2
+    # so it can be used with a base-octave change ('>' and '<' count like "'" and ",")
+    delta = (
+        octave1.count("'")
+        + octave1.count(">")
+        - octave1.count(",")
+        - octave1.count("<")
+        + octave2.count("'")
+        + octave2.count(">")
+        - octave2.count(",")
+        - octave2.count("<")
+    )
+    if delta >= 0:
+        return "'" * delta
+    return "," * -delta
+
+
+_VALID_ACCIDENTALS = frozenset(("", "#", "b"))
+
+# Small per-note dispatch tables, hoisted so toMarkup/_process_figures do
+# not rebuild them on every note
+_FIG_NAMES = {
+    "0": "nought",
+    "1": "one",
+    "2": "two",
+    "3": "three",
+    "4": "four",
+    "5": "five",
+    "6": "six",
+    "7": "seven",
+    "-": "dash",
+}
+_ACC_NAME_SUFFIX = {"#": "-sharp", "b": "-flat", "": ""}
+_ACC_LY = {"": "", "#": "is", "b": "es"}
+_OCT_LY = {"": "'", "'": "''", "''": "'''", ",": "", ",,": ","}
+_CHORD_LOW_OCT = {",": "", ",,": ","}
+_CHORD_HIGH_OCT = {"'": "''", "''": "'''"}
+_O_DICT_NOBEAMS = {
+    "": "",
+    "'": "^.",
+    "''": r"-\tweak #'X-offset #0.3 ^\markup{\bold :}",
+    # Need to move it further right to avoid LilyPond put dot too low
+    ",": r"""-\tweak #'X-offset #0.54 _\markup{\musicglyph #"dots.dot"}""",
+    ",,": r"-\tweak #'X-offset #0.54 _\markup{\fontsize #2 \bold :}",
+}
+_O_DICT_BEAMS = {
+    "": "",
+    "'": "^.",
+    "''": r"-\tweak #'X-offset #0.3 ^\markup{\bold :}",
+    ",": r"""-\tweak #'X-offset #0.3 _\markup{\musicglyph #"dots.dot"}""",
+    ",,": r"-\tweak #'X-offset #0.3 _\markup{\fontsize #2 \bold :}",
+}
+_O_DICT_ANGKA_OVERRIDE = {
+    "'": r"-\tweak #'extra-offset #'(0.4 . 2.7) -\markup{\bold \fontsize #2 ·}",
+    "''": r"-\tweak #'extra-offset #'(0.4 . 3.5) -\markup{\bold :}",
+}
+_O_DICT_NOBEAMS_ANGKA = {**_O_DICT_NOBEAMS, **_O_DICT_ANGKA_OVERRIDE}
+_O_DICT_BEAMS_ANGKA = {**_O_DICT_BEAMS, **_O_DICT_ANGKA_OVERRIDE}
+
+
+@functools.lru_cache(maxsize=None)
+def _beam_count_overrides(leftBeams, nBeams):
+    """Returns the (cached) stem beam-count override pair for a note."""
+    return (
+        "\\set stemLeftBeamCount = #%d\n"
+        "\\set stemRightBeamCount = #%d\n" % (leftBeams, nBeams)
+    )
+
+# Whole-bar rest lengths keyed on barLength (in 1/192-whole-note ticks)
+_WHOLE_BAR_REST = {288: "1.", 144: "2.", 96: "2", 72: "4.", 48: "4", 36: "8.", 24: "8"}
 
 
 class NoteheadMarkup:
@@ -780,6 +898,7 @@ class NoteheadMarkup:
         - withStaff (bool): whether to include staff in the object or not.
         """
         self.defines_done = {}
+        self._applyout_done = {}
         self.withStaff = withStaff
         self.initOneScore()
 
@@ -787,41 +906,56 @@ class NoteheadMarkup:
         """
         Initializes the score.
         """
-        self.barLength = 64
-        self.beatLength = 16  # in 64th notes
-        self.barPos = self.startBarPos = F(0)
+        # Positions and lengths are integer counts of 1/192-whole-note ticks
+        # (the LCM of the 64th-note and compound-beat units), so ordinary
+        # bar arithmetic stays in plain ints rather than Fractions
+        self.barLength = 192
+        self.beatLength = 48
+        self.barPos = self.startBarPos = 0
         self.inBeamGroup = (
             self.lastNBeams
         ) = self.onePage = self.noBarNums = self.separateTimesig = 0
         self.keepLength = 0
         self.last_octaves = self.last_accidentals = []
         self.base_octave = ""
-        self.current_accidentals = {}
+        self._reset_accidentals()
         self.barNo = 1
         self.tuplet = (1, 1)
         self.last_figures = None
         self.last_was_rest = False
-        self.notesHad = []
+        # memoized figures-tuple -> placeholder chord (depends on the
+        # midi/western globals, so reset along with the score)
+        self._placeholder_cache = {}
+        self.notesHad = []  # raw figures lists; joined only if an error needs them
         self.unicode_approx = []
 
+    def _reset_accidentals(self):
+        """
+        Clears the accidental state, one mask-dict per standard octave
+        (indexed via _OCT_INDEX), plus an overflow dict for the unusual
+        joined-octave strings chords can produce.
+        """
+        self.current_accidentals = [{"": _ALL_FIGS_MASK} for _ in range(5)]
+        self._odd_octave_accidentals = {}
+
     def endScore(self):
         """
         Ends the score.
         """
         if self.barPos == self.startBarPos:
             pass
-        elif os.environ.get("j2ly_sloppy_bars", ""):
+        elif _SLOPPY_BARS:
             sys.stderr.write(
                 f"Wrong bar length at end of score {scoreNo} ignored (j2ly_sloppy_bars set)\n"
             )
         elif self.startBarPos and not self.barPos:
             # this is on the music theory syllabi at about Grade 3, but you can get up to Grade 5 practical without actually covering it, so we'd better not expect all users to understand "final bar does not make up for anacrusis bar"
             errExit(
-                f"Score {scoreNo} should end with a {self.startBarPos / self.beatLength}-beat bar to make up for the {(self.barLength - self.startBarPos) / self.beatLength}-beat anacrusis bar.  Set j2ly_sloppy_bars environment variable if you really want to break this rule."
+                f"Score {scoreNo} should end with a {F(self.startBarPos) / self.beatLength}-beat bar to make up for the {F(self.barLength - self.startBarPos) / self.beatLength}-beat anacrusis bar.  Set j2ly_sloppy_bars environment variable if you really want to break this rule."
             )
         else:
             errExit(
-                f"Incomplete bar at end of score {scoreNo} ({self.barPos/self.beatLength} beats)"
+                f"Incomplete bar at end of score {scoreNo} ({F(self.barPos)/self.beatLength} beats)"
             )
 
     def setTime(self, num, denom):
@@ -832,11 +966,11 @@ class NoteheadMarkup:
         - num (int): the numerator of the time signature.
         - denom (int): the denominator of the time signature.
         """
-        self.barLength = int(64 * num / denom)
+        self.barLength = 192 * num // denom
         if denom > 4 and num % 3 == 0:
-            self.beatLength = 24  # compound time
+            self.beatLength = 72  # compound time
         else:
-            self.beatLength = 16
+            self.beatLength = 48
 
     def setAnac(self, denom, dotted):
         """
@@ -846,9 +980,12 @@ class NoteheadMarkup:
         - denom (int): the denominator of the anacrusis.
         - dotted (bool): whether the anacrusis is dotted or not.
         """
-        self.barPos = F(self.barLength) - F(64) / denom
+        barPos = F(self.barLength) - F(192) / denom
         if dotted:
-            self.barPos -= F(64) / denom / 2
+            barPos -= F(192) / denom / 2
+        # keep integral positions as plain ints (once-per-score, so the
+        # exactness check is cheap)
+        self.barPos = int(barPos) if barPos == int(barPos) else barPos
         if self.barPos < 0:
             # but anacrusis being exactly equal to bar is OK: we'll just interpret that as no anacrusis
             errExit(f"Anacrusis is longer than bar in score {scoreNo}")
@@ -858,9 +995,7 @@ class NoteheadMarkup:
         """
         Returns the length of a whole bar rest.
         """
-        return {96: "1.", 48: "2.", 32: "2", 24: "4.", 16: "4", 12: "8.", 8: "8"}.get(
-            self.barLength, "1"
-        )  # TODO: what if irregular?
+        return _WHOLE_BAR_REST.get(self.barLength, "1")  # TODO: what if irregular?
 
     def baseOctaveChange(self, change):
         """
@@ -893,9 +1028,29 @@ class NoteheadMarkup:
                 scoreError("Dash not allowed in multi-figure chords:", word, line)
 
         for acc in accidentals:
-            if acc not in ["", "#", "b"]:
+            if acc not in _VALID_ACCIDENTALS:
                 scoreError("Can't handle accidental " + acc + " in", word, line)
 
+    def _get_placeholder_chord(self, figures):
+        """
+        Returns (placeholder, notes) for the given figures, where notes is
+        the pre-split list of chord note letters (None unless placeholder
+        is a chord).  Memoized per score since the same chord recurs
+        constantly.
+        """
+        key = tuple(figures)
+        v = self._placeholder_cache.get(key)
+        if v is None:
+            if len(figures) == 1:
+                v = (chr(_PH_LUT[ord(figures[0])]), None)
+            elif not midi and not western:
+                v = ("c", None)  # Override appearance
+            else:
+                notes = [chr(_PH_LUT[ord(f)]) for f in figures]
+                v = ("< " + " ".join(notes) + " >", notes)
+            self._placeholder_cache[key] = v
+        return v
+
     def _process_figures(self, figures, accidentals, octaves, word, line):
         """
         Processes the figures to extract note names and placeholder chords.
@@ -910,31 +1065,14 @@ class NoteheadMarkup:
         Returns:
         - names (list of str): List of concatenated names of the notes.
         - placeholder_chord (str): Placeholder chord string.
+        - chord_notes (list of str or None): Pre-split chord note letters.
         - updated_figures (list of str): Modified figures.
         - updated_accidentals (list of str): Modified accidentals.
         - updated_octaves (list of str): Modified octaves.
         - invisTieLast (bool): Flag indicating if an invisible tie is present.
         """
 
-        names = {
-            "0": "nought",
-            "1": "one",
-            "2": "two",
-            "3": "three",
-            "4": "four",
-            "5": "five",
-            "6": "six",
-            "7": "seven",
-            "-": "dash",
-        }
-
-        def get_placeholder_chord(figures):
-            if len(figures) == 1:
-                return placeholders[figures[0]]
-            elif not midi and not western:
-                return "c"  # Override appearance
-            else:
-                return "< " + " ".join(placeholders[f] for f in figures) + " >"
+        names = _FIG_NAMES
 
         invisTieLast = (
             dashes_as_ties
@@ -952,17 +1090,20 @@ class NoteheadMarkup:
             octaves = self.last_octaves  # for MIDI or 5-line
             accidentals = self.last_accidentals
             combined_name = "-" + "".join(names[f] for f in self.last_figures)
-            placeholder_chord = get_placeholder_chord(self.last_figures)
+            placeholder_chord, chord_notes = self._get_placeholder_chord(
+                self.last_figures
+            )
         else:
             combined_name = ""
+            _not_angka = not_angka  # fast local for the per-figure loop
             for fig, acc in zip(figures, accidentals):
                 name = names[fig]
-                if not_angka:
+                if _not_angka:
                     fig += acc
-                    name += {"#": "-sharp", "b": "-flat", "": ""}[fig]
+                    name += _ACC_NAME_SUFFIX[fig]
                 combined_name += name
 
-            placeholder_chord = get_placeholder_chord(figures)
+            placeholder_chord, chord_notes = self._get_placeholder_chord(figures)
             octaves = [addOctaves(octv, self.base_octave) for octv in octaves]
             for octave in octaves:
                 if octave not in [",,", ",", "", "'", "''"]:
@@ -982,6 +1123,7 @@ class NoteheadMarkup:
         return (
             combined_name,
             placeholder_chord,
+            chord_notes,
             figures,
             accidentals,
             octaves,
@@ -1005,16 +1147,21 @@ class NoteheadMarkup:
         - line (int): for error handling.
         """
 
+        # Read the mode globals into fast locals once per call
+        _midi, _western, _not_angka = midi, western, not_angka
+        _notmw = not _midi and not _western
+
         # Validate figures
         self._validate_figures(figures, accidentals, word, line)
 
         # Keep track of notes processed
-        self.notesHad.append("".join(figures))
+        self.notesHad.append(figures)
 
         # Process figures
         (
             name,
             placeholder_chord,
+            chord_notes,
             figures,
             accidentals,
             octaves,
@@ -1025,20 +1172,29 @@ class NoteheadMarkup:
             figures = "-" + "".join([f[1:] for f in figures])
         else:
             figures = "".join(figures)
+        # intern: the same few figures strings recur as dict keys throughout
+        figures = sys.intern(figures)
         octave = "".join(octaves)
         accidental = "".join(accidentals)
 
-        if figures not in self.defines_done and not midi and not western:
+        # Assemble the markup as a list of fragments, joined once at the
+        # points that need the materialized string
+        parts = []
+        if _notmw and figures not in self.defines_done:
             # Define a notehead graphical object for the figures
             self.defines_done[figures] = "note-" + name
+            # cache the per-note \applyOutput prefix alongside the define
+            self._applyout_done[figures] = (
+                r"  \applyOutput #'Voice #" + self.defines_done[figures] + " "
+            )
             if figures.startswith("-"):
-                if not_angka:
+                if _not_angka:
                     figuresNew = "."
                 else:
                     figuresNew = "\u2013"
             else:
                 figuresNew = figures
-            ret = (
+            parts.append(
                 """#(define (%s grob grob-origin context)
   (if (and (eq? (ly:context-property context 'chordChanges) #t)
       (or (grob::has-interface grob 'note-head-interface)
@@ -1052,19 +1208,23 @@ class NoteheadMarkup:
             k = len(self.last_figures)
             if figures.startswith("-") and k > 1:
                 # Repeat the en-dash k times vertically
-                ret += '''(markup (#:lower 0.5
+                parts.append('''(markup (#:lower 0.5
                     (#:override (cons (quote direction) 1)
                     (#:override (cons (quote baseline-skip) 1.8)
                     (#:dir-column (
-                    {})))))))))))'''.format("#:line (#:bold \"–\")\n" * k)
+                    {})))))))))))'''.format("#:line (#:bold \"–\")\n" * k))
             elif len(figuresNew) == 1 or figures.startswith("-"):
-                ret += f'(make-lower-markup 0.5 (make-bold-markup "{figuresNew}")))))))\n'
-            elif not_angka and accidental:  # not chord
+                parts.append(
+                    f'(make-lower-markup 0.5 (make-bold-markup "{figuresNew}")))))))\n'
+                )
+            elif _not_angka and accidental:  # not chord
                 # TODO: the \ looks better than the / in default font
                 accidental_markup = {"#": "\u0338", "b": "\u20e5"}[accidental]
-                ret += f'(make-lower-markup 0.5 (make-bold-markup "{figures[:1]}{accidental_markup}")))))))\n'
+                parts.append(
+                    f'(make-lower-markup 0.5 (make-bold-markup "{figures[:1]}{accidental_markup}")))))))\n'
+                )
             else:
-                ret += (
+                parts.append(
                     """(markup (#:lower 0.5
           (#:override (cons (quote direction) 1)
           (#:override (cons (quote baseline-skip) 1.8)
@@ -1073,15 +1233,31 @@ class NoteheadMarkup:
                     + """)))))))))))
 """
                 )  # TODO: can do accidentals e.g. #:halign 1 #:line ((#:fontsize -5 (#:raise 0.7 (#:flat))) (#:bold "3")) but might cause the beam not to extend its full length if this chord occurs at the end of a beamed group, + accidentals won't be tracked by Lilypond and would have be taken care of by jianpu-ly (which might mean if any chord has an accidental on one of its notes we'd have to do all notes in that bar like this, whether they are chords or not)
-        else:
-            ret = ""
         if self.barPos == 0 and self.barNo > 1:
-            ret += "| "  # barline in Lilypond file: not strictly necessary but may help readability
-            if self.onePage and not midi:
-                ret += r"\noPageBreak "
-            ret += "%{ bar " + str(self.barNo) + ": %} "
-        if octave not in self.current_accidentals:
-            self.current_accidentals[octave] = [""] * 7
+            parts.append(
+                "| "
+            )  # barline in Lilypond file: not strictly necessary but may help readability
+            if self.onePage and not _midi:
+                parts.append(r"\noPageBreak ")
+            parts.append("%{ bar " + str(self.barNo) + ": %} ")
+        # each octave's mask-dict maps accidental strings to a bitmask of
+        # the figures currently carrying them
+        idx = _OCT_INDEX.get(octave)
+        if idx is not None:
+            acc_masks = self.current_accidentals[idx]
+        else:
+            acc_masks = self._odd_octave_accidentals.setdefault(
+                octave, {"": _ALL_FIGS_MASK}
+            )
+        figs_mask = 0
+        figs_all_digits = True
+        for figure in figures:
+            bit = _FIG_DIGIT_BIT.get(figure, 0)
+            if bit:
+                figs_mask |= bit
+            else:
+                figs_all_digits = False
+        acc_cur = acc_masks.get(accidental, 0)  # nothing writes until below
         if nBeams == None:  # unspecified
             if self.keepLength:
                 nBeams = self.lastNBeams
@@ -1089,11 +1265,8 @@ class NoteheadMarkup:
                 nBeams = 0
         if (
             figures == "-"
-            or all(
-                "1" <= figure <= "7"
-                and not accidental == self.current_accidentals[octave][int(figure) - 1]
-                for figure in list(figures)
-            )
+            or figs_all_digits
+            and not figs_mask & acc_cur
             and nBeams > self.lastNBeams
         ):
             leftBeams = nBeams  # beam needs to fit under the new accidental (or the dash which might be slightly to the left of where digits are), but if it's no more than last note's beams then we'll hang it only if in same beat.  (TODO: the current_accidentals logic may need revising if other accidental styles are used, e.g. modern-cautionary, although then would need to check anyway if our \consists "Accidental_engraver" is sufficient)
@@ -1114,43 +1287,51 @@ class NoteheadMarkup:
             if not self.inBeamGroup == "restHack":
                 aftrlast0 = "] "
             self.inBeamGroup = 0
-        length = 4
-        b = 0
-        toAdd = F(16)  # crotchet
-        while b < nBeams:
-            b, length, toAdd = b + 1, length * 2, toAdd / 2
+        length = 4 << nBeams
+        toAdd = 48  # crotchet, in 1/192-whole-note ticks
+        for _ in range(nBeams):
+            # same integral-until-necessary halving as the dot loop below
+            # (5+ beams no longer divide the tick base evenly)
+            toAdd = toAdd // 2 if toAdd % 2 == 0 else F(toAdd) / 2
         toAdd0 = toAdd
         for _ in dots:
-            toAdd0 /= 2
+            # stays integral down to a singly-dotted 64th; Fractions only
+            # for the pathological cases beyond that
+            toAdd0 = toAdd0 // 2 if toAdd0 % 2 == 0 else F(toAdd0) / 2
             toAdd += toAdd0
         toAdd_preTuplet = toAdd
         if not self.tuplet[0] == self.tuplet[1]:
-            toAdd = toAdd * self.tuplet[0] / self.tuplet[1]
+            scaled = toAdd * self.tuplet[0]
+            if isinstance(scaled, int) and scaled % self.tuplet[1] == 0:
+                toAdd = scaled // self.tuplet[1]
+            else:
+                toAdd = F(scaled) / self.tuplet[1]
         # must set these unconditionally regardless of what we think their current values are (Lilypond's own beamer can change them from note to note)
-        if nBeams and not midi and not western:
-            if not_angka:
+        if nBeams and _notmw:
+            if _not_angka:
                 leftBeams = nBeams
                 if (self.barPos + toAdd) % self.beatLength == 0:
                     nBeams = 0
-            ret += (r"\set stemLeftBeamCount = #%d" + "\n") % leftBeams
-            ret += (r"\set stemRightBeamCount = #%d" + "\n") % nBeams
-            if not_angka:
+            parts.append(_beam_count_overrides(leftBeams, nBeams))
+            if _not_angka:
                 nBeams = leftBeams
-        need_space_for_accidental = False
-        for figure in list(figures):
-            if "1" <= figure <= "7":
-                if not accidental == self.current_accidentals[octave][int(figure) - 1]:
-                    need_space_for_accidental = True
-                # TODO: not sensible (assumes accidental applies to EVERY note in the chord, see above)
-                self.current_accidentals[octave][int(figure) - 1] = accidental
+        # TODO: not sensible (assumes accidental applies to EVERY note in the chord, see above)
+        need_space_for_accidental = bool(figs_mask & ~acc_cur)
+        if figs_mask:
+            for k in acc_masks:
+                acc_masks[k] &= ~figs_mask
+            acc_masks[accidental] = acc_cur | figs_mask
         inRestHack = 0
-        if not midi and not western:
-            if ret:
-                ret = ret.rstrip() + "\n"  # try to keep the .ly code vaguely readable
+        if _notmw:
+            if parts:
+                # try to keep the .ly code vaguely readable
+                parts = ["".join(parts).rstrip(), "\n"]
             if octave == "''" and not invisTieLast:
                 # inside bar numbers etc
-                ret += r"  \once \override Score.TextScript.outside-staff-priority = 45"
-            ret += r"  \applyOutput #'Voice #" + self.defines_done[figures] + " "
+                parts.append(
+                    r"  \once \override Score.TextScript.outside-staff-priority = 45"
+                )
+            parts.append(self._applyout_done[figures])
             if placeholder_chord == "r" and use_rest_hack and nBeams:
                 placeholder_chord = "c"
                 # C to work around diagonal-tail problem with
@@ -1159,60 +1340,66 @@ class NoteheadMarkup:
                 # so lyrics miss it as if it were a rest:
                 # (OK if self.withStaff: lyrics will be attached to that instead)
                 if has_lyrics and not self.withStaff:
-                    ret = jianpu_voice_start(1)[0] + ret
+                    parts.insert(0, jianpu_voice_start(1)[0])
                     inRestHack = 1
                     if self.inBeamGroup and not self.inBeamGroup == "restHack":
                         aftrlast0 = "] "
         if placeholder_chord.startswith("<"):
             # Octave with chords: apply to last note if up, 1st note if down
-            notes = placeholder_chord.split()[1:-1]
+            notes = list(chord_notes)  # pre-split at cache-fill time
             assert len(notes) >= 2
-            notes[0] += {",": "", ",,": ","}.get(octave, "'")
+            notes[0] += _CHORD_LOW_OCT.get(octave, "'")
             for n in range(1, len(notes) - 1):
                 notes[n] += "'"
-            notes[-1] += {"'": "''", "''": "'''"}.get(octave, "'")
-            ret += "< " + " ".join(notes) + " >"
+            notes[-1] += _CHORD_HIGH_OCT.get(octave, "'")
+            parts.append("< " + " ".join(notes) + " >")
         else:  # single note or rest
-            ret += placeholder_chord + {"": "", "#": "is", "b": "es"}[accidental]
+            parts.append(placeholder_chord + _ACC_LY[accidental])
             if not placeholder_chord == "r":
-                ret += {"": "'", "'": "''", "''": "'''", ",": "", ",,": ","}[
-                    octave
-                ]  # for MIDI + Western, put it so no-mark starts near middle C
-        ret += f"{length}{dots}"
+                # for MIDI + Western, put it so no-mark starts near middle C
+                parts.append(_OCT_LY[octave])
+        parts.append(f"{length}{dots}")
 
         if tremolo:
-            self._apply_tremolo_to_note(
-                ret, placeholder_chord, tremolo, midi or western,
-                toAdd_preTuplet, dots
-            )
+            # _apply_tremolo_to_note returns the whole markup with the
+            # tremolo applied, so replace the parts collected so far
+            parts = [
+                self._apply_tremolo_to_note(
+                    "".join(parts),
+                    placeholder_chord,
+                    tremolo,
+                    not _notmw,
+                    toAdd_preTuplet,
+                    dots,
+                )
+            ]
 
         if (
             nBeams
             and (not self.inBeamGroup or self.inBeamGroup == "restHack" or inRestHack)
-            and not midi
-            and not western
+            and _notmw
         ):
             # We need the above stemLeftBeamCount, stemRightBeamCount override logic to work even if we're an isolated quaver, so do this:
-            ret += "["
+            parts.append("[")
             self.inBeamGroup = 1
         self.barPos += toAdd
         # sys.stderr.write(accidental+figure+octave+dots+"/"+str(nBeams)+"->"+str(self.barPos)+" ") # if need to see where we are
         if self.barPos > self.barLength:
             errExit(
-                f'(notesHad={" ".join(self.notesHad)}) barcheck fail: note crosses barline at "{figures}" with {nBeams} beams ({toAdd} skipped from {self.barPos - toAdd} to {self.barPos}, bypassing {self.barLength}), scoreNo={scoreNo} barNo={self.barNo} (but the error could be earlier)'
+                f'(notesHad={" ".join("".join(x) for x in self.notesHad)}) barcheck fail: note crosses barline at "{figures}" with {nBeams} beams ({toAdd} skipped from {self.barPos - toAdd} to {self.barPos}, bypassing {self.barLength}), scoreNo={scoreNo} barNo={self.barNo} (but the error could be earlier)'
             )
         # (self.inBeamGroup is set only if not midi/western)
         if self.barPos % self.beatLength == 0 and self.inBeamGroup:
             # jianpu printouts tend to restart beams every beat
             # (but if there are no beams running anyway, it occasionally helps typesetting to keep the logical group running, e.g. to work around bugs involving beaming a dash-and-rest beat in 6/8) (TODO: what if there's a dash-and-rest BAR?  [..]-notated beams don't usually work across barlines
-            ret += "]"
+            parts.append("]")
             # DON'T reset lastNBeams here (needed for start-of-group accidental logic)
             self.inBeamGroup = 0
         elif inRestHack and self.inBeamGroup:
-            ret += "]"
+            parts.append("]")
             self.inBeamGroup = "restHack"
         self.lastNBeams = nBeams
-        beamC = "\u0333" if nBeams >= 2 else "\u0332" if nBeams == 1 else ""
+        beamC = _BEAMC[nBeams if nBeams < 4 else 4]
         self.unicode_approx.append(
             ""
             + ("-" if invisTieLast else figures[-1:])
@@ -1222,44 +1409,24 @@ class NoteheadMarkup:
                 else ("\u0323" if "," in octave else "\u0307" if "'" in octave else "")
             )
             + beamC
-            + "".join(c + beamC for c in dots)
+            + ("".join(c + beamC for c in dots) if dots else "")
             + ("" if self.inBeamGroup else " ")
         )  # (NB inBeamGroup is correct only if not midi and not western)
         if self.barPos == self.barLength:
             self.unicode_approx[-1] = self.unicode_approx[-1].rstrip() + "\u2502"
             self.barPos = 0
             self.barNo += 1
-            self.current_accidentals = {}
+            self._reset_accidentals()
         # Octave dots:
-        if not midi and not western and not invisTieLast:
+        if _notmw and not invisTieLast:
             # Tweak the Y-offset, as Lilypond occasionally puts it too far down:
-            if not nBeams:
-                oDict = {
-                    "": "",
-                    "'": "^.",
-                    "''": r"-\tweak #'X-offset #0.3 ^\markup{\bold :}",
-                    # Need to move it further right to avoid LilyPond put dot too low
-                    ",": r"""-\tweak #'X-offset #0.54 _\markup{\musicglyph #"dots.dot"}""",
-                    ",,": r"-\tweak #'X-offset #0.54 _\markup{\fontsize #2 \bold :}",
-                }
+            if _not_angka:
+                oDict = _O_DICT_BEAMS_ANGKA if nBeams else _O_DICT_NOBEAMS_ANGKA
             else:
-                oDict = {
-                    "": "",
-                    "'": "^.",
-                    "''": r"-\tweak #'X-offset #0.3 ^\markup{\bold :}",
-                    ",": r"""-\tweak #'X-offset #0.3 _\markup{\musicglyph #"dots.dot"}""",
-                    ",,": r"-\tweak #'X-offset #0.3 _\markup{\fontsize #2 \bold :}",
-                }
-            if not_angka:
-                oDict.update(
-                    {
-                        "'": r"-\tweak #'extra-offset #'(0.4 . 2.7) -\markup{\bold \fontsize #2 ·}",
-                        "''": r"-\tweak #'extra-offset #'(0.4 . 3.5) -\markup{\bold :}",
-                    }
-                )
-            ret += oDict[octave]
+                oDict = _O_DICT_BEAMS if nBeams else _O_DICT_NOBEAMS
+            parts.append(oDict[octave])
         if invisTieLast:
-            if midi or western:
+            if not _notmw:
                 b4last, aftrlast = "", " ~"
             else:
                 b4last, aftrlast = (
@@ -1269,7 +1436,8 @@ class NoteheadMarkup:
         else:
             b4last, aftrlast = "", ""
         if inRestHack:
-            ret += " } "
+            parts.append(" } ")
+        ret = "".join(parts)
         return (
             b4last,
             aftrlast0 + aftrlast,
@@ -1303,8 +1471,8 @@ class NoteheadMarkup:
                 # Handling tremolo for chords in MIDI/Western notation
                 previous, n1, n2, gtLenDot = ret.rsplit(None, 3)
                 previous = previous[:-1]  # drop <
-                tremolo_count = int(toAdd_preTuplet / 4)
-                return f"{previous}\repeat tremolo {tremolo_count} {{ {n1}32 {n2}32 }}"
+                tremolo_count = int(toAdd_preTuplet / 12)
+                return f"{previous}\\repeat tremolo {tremolo_count} {{ {n1}32 {n2}32 }}"
             else:
                 return ret + tremolo
         else:
@@ -1326,48 +1494,118 @@ class NoteheadMarkup:
         if tremolo != ":32":
             return ""
 
-        if lilypond_minor_version() >= 22:
-            if dots:
-                return (
-                    r"""_\tweak outside-staff-priority ##f """
-                    r"""^\tweak avoid-slur #'inside """
-                    r"""_\markup {\with-dimensions #'(0 . 0) #'(2.8 . 2.1) """
-                    r"""\postscript "1.6 -0.2 moveto 2.6 0.8 lineto 1.8 -0.4 moveto """
-                    r"""2.8 0.6 lineto 2.0 -0.6 moveto 3.0 0.4 lineto stroke" } """
-                    r"""%{ requires Lilypond 2.22+ %} """
-                )
-            else:
-                return (
-                    r"""_\tweak outside-staff-priority ##f """
-                    r"""^\tweak avoid-slur #'inside """
-                    r"""_\markup {\with-dimensions #'(0 . 0) #'(2.5 . 2.1) """
-                    r"""\postscript "1.1 0.4 moveto 2.1 1.4 lineto 1.3 0.2 moveto """
-                    r"""2.3 1.2 lineto 1.5 0.0 moveto 2.5 1.0 lineto stroke" } """
-                    r"""%{ requires Lilypond 2.22+ %} """
-                )
-        elif lilypond_minor_version() < 20:
-            errExit(
-                "tremolo requires Lilypond 2.20+, we found 2."
-                + str(lilypond_minor_version())
-            )
-        elif dots:
-            return (
-                r"""_\tweak outside-staff-priority ##f """
-                r"""^\tweak avoid-slur #'inside """
-                r"""_\markup {\with-dimensions #'(0 . 0) #'(2.8 . 2.6) """
-                r"""\postscript "1.4 1.6 moveto 2.4 2.6 lineto 1.6 1.4 moveto """
-                r"""2.6 2.4 lineto 1.8 1.2 moveto 2.8 2.2 lineto stroke" } """
-                r"""%{ requires Lilypond 2.20 %} """
-            )
+        v = lilypond_minor_version()
+        if v < 20:
+            errExit("tremolo requires Lilypond 2.20+, we found 2." + str(v))
+        return _TREMOLO_MARKUP[(v >= 22, bool(dots))]
+
+
+# Tremolo slash markup, selected on (Lilypond >= 2.22, note is dotted)
+_TREMOLO_MARKUP = {
+    (True, True): (
+        r"""_\tweak outside-staff-priority ##f """
+        r"""^\tweak avoid-slur #'inside """
+        r"""_\markup {\with-dimensions #'(0 . 0) #'(2.8 . 2.1) """
+        r"""\postscript "1.6 -0.2 moveto 2.6 0.8 lineto 1.8 -0.4 moveto """
+        r"""2.8 0.6 lineto 2.0 -0.6 moveto 3.0 0.4 lineto stroke" } """
+        r"""%{ requires Lilypond 2.22+ %} """
+    ),
+    (True, False): (
+        r"""_\tweak outside-staff-priority ##f """
+        r"""^\tweak avoid-slur #'inside """
+        r"""_\markup {\with-dimensions #'(0 . 0) #'(2.5 . 2.1) """
+        r"""\postscript "1.1 0.4 moveto 2.1 1.4 lineto 1.3 0.2 moveto """
+        r"""2.3 1.2 lineto 1.5 0.0 moveto 2.5 1.0 lineto stroke" } """
+        r"""%{ requires Lilypond 2.22+ %} """
+    ),
+    (False, True): (
+        r"""_\tweak outside-staff-priority ##f """
+        r"""^\tweak avoid-slur #'inside """
+        r"""_\markup {\with-dimensions #'(0 . 0) #'(2.8 . 2.6) """
+        r"""\postscript "1.4 1.6 moveto 2.4 2.6 lineto 1.6 1.4 moveto """
+        r"""2.6 2.4 lineto 1.8 1.2 moveto 2.8 2.2 lineto stroke" } """
+        r"""%{ requires Lilypond 2.20 %} """
+    ),
+    (False, False): (
+        r"""_\tweak outside-staff-priority ##f """
+        r"""^\tweak avoid-slur #'inside """
+        r"""_\markup {\with-dimensions #'(0 . 0) #'(2.5 . 2.6) """
+        r"""\postscript "1.1 1.6 moveto 2.1 2.6 lineto 1.3 1.4 moveto """
+        r"""2.3 2.4 lineto 1.5 1.2 moveto 2.5 2.2 lineto stroke" } """
+        r"""%{ requires Lilypond 2.20 %} """
+    ),
+}
+
+# Deletion tables deriving figures/accidentals/octaves from a note fragment
+# in one C-level translate pass each
+_T_FIG = str.maketrans("", "", "#b',")
+_T_ACC = str.maketrans("", "", "01234567',-")
+_T_OCT = str.maketrans("", "", "#b01234567")
+_BEAM_CHARS = frozenset("cqsdh\\")
+_BEAM_CHAR_TO_COUNT = {"c": 0, "q": 1, "s": 2, "d": 3, "h": 4}
+_FIGURE_CHARS = frozenset("01234567-")
+# One bit per figure 1-7, for the per-octave accidental bitmasks
+_FIG_DIGIT_BIT = {"1": 1, "2": 2, "3": 4, "4": 8, "5": 16, "6": 32, "7": 64}
+_ALL_FIGS_MASK = 0b1111111
+_OCT_INDEX = {",,": 0, ",": 1, "": 2, "'": 3, "''": 4}
+# Combining low-line characters for the unicode approximation, by beam count
+_BEAMC = ("", "̲", "̳", "̳", "̳")
+
+
+def _scan_word(word, origWord, line):
+    """
+    Classify each character of a note word in a single pass.
+
+    Splits the word into figure fragments (optional #/b accidentals, a
+    figure, then any octave marks), a count of duration dots and the
+    beam letters, validating the character set as it goes.  Equivalent
+    to matching each fragment against [#b]*[-0-7][',]* but without the
+    separate validation, findall and filtering passes over the word.
+
+    Returns (fragments, ndots, beam_str).
+    """
+    fragments = []
+    acc = []  # accidental chars not yet attached to a figure
+    frag = None  # the fragment currently accepting octave marks
+    ndots = 0
+    beams = []
+    for c in word:
+        if c in _FIGURE_CHARS:
+            if frag is not None:
+                fragments.append("".join(frag))
+            frag = acc + [c]
+            acc = []
+        elif c == "'" or c == ",":
+            # Octave marks bind only to an immediately preceding figure
+            if frag is not None:
+                frag.append(c)
+            acc = []
+        elif c == "#" or c == "b":
+            if frag is not None:
+                fragments.append("".join(frag))
+                frag = None
+            acc.append(c)
+        elif c == ".":
+            ndots += 1
+            if frag is not None:
+                fragments.append("".join(frag))
+                frag = None
+            acc = []
+        elif c in _BEAM_CHARS:
+            beams.append(c)
+            if frag is not None:
+                fragments.append("".join(frag))
+                frag = None
+            acc = []
         else:
-            return (
-                r"""_\tweak outside-staff-priority ##f """
-                r"""^\tweak avoid-slur #'inside """
-                r"""_\markup {\with-dimensions #'(0 . 0) #'(2.5 . 2.6) """
-                r"""\postscript "1.1 1.6 moveto 2.1 2.6 lineto 1.3 1.4 moveto """
-                r"""2.3 2.4 lineto 1.5 1.2 moveto 2.5 2.2 lineto stroke" } """
-                r"""%{ requires Lilypond 2.20 %} """
-            )
+            # unrecognised stuff in it: flag as error, rather than ignoring
+            # and possibly getting a puzzling barsync fail
+            scoreError("Unrecognised command", origWord, line)
+    if frag is not None:
+        fragments.append("".join(frag))
+    if not word:
+        scoreError("Unrecognised command", origWord, line)
+    return fragments, ndots, "".join(beams)
 
 
 def parseNote(word, origWord, line):
@@ -1404,30 +1642,25 @@ def parseNote(word, origWord, line):
         tremolo, word = ":32", word.replace("///", "", 1)
     else:
         tremolo = ""
-    # unrecognised stuff in it: flag as error, rather than ignoring and possibly getting a puzzling barsync fail
-    if not re.match(r"[0-7.,'cqsdh\\#b-]+$", word):
-        scoreError("Unrecognised command", origWord, line)
-
-    # Identify figures with accidentals and octave indicators
-    notes_with_accidental_octave = re.findall(r"[#b]*[-0-7][',]*", word)
-    figures = [re.sub(r"[#b',]+", "", note) for note in notes_with_accidental_octave]
-    accidentals = [
-        re.sub(r"[0-7',-]", "", note) for note in notes_with_accidental_octave
-    ]
-    octaves = [re.sub(r"[#b0-7]", "", note) for note in notes_with_accidental_octave]
-
-    dots = "".join(c for c in word if c == ".")
-    nBeams = "".join(re.findall(r"[cqsdh\\]", word))
-    if re.match(r"[\\]+$", nBeams):
+    # Single pass over the word: validate the charset and pick out figure
+    # fragments, dots and beam letters as we go
+    notes_with_accidental_octave, ndots, nBeams = _scan_word(word, origWord, line)
+    figures = [note.translate(_T_FIG) for note in notes_with_accidental_octave]
+    accidentals = [note.translate(_T_ACC) for note in notes_with_accidental_octave]
+    octaves = [note.translate(_T_OCT) for note in notes_with_accidental_octave]
+
+    dots = "." * ndots
+    if nBeams and all(c == "\\" for c in nBeams):
         nBeams = len(
             nBeams
         )  # requested by a user who found British note-length names hard to remember; won't work if the \ is placed at the start, as that'll be a Lilypond command, so to save confusion we won't put this in the docstring
     elif nBeams:
-        try:
-            nBeams = list("cqsdh").index(nBeams)
-        except ValueError:
+        beam_str, nBeams = nBeams, _BEAM_CHAR_TO_COUNT.get(nBeams)
+        if nBeams is None:
             scoreError(
-                "Can't calculate number of beams from " + nBeams + " in", origWord, line
+                "Can't calculate number of beams from " + beam_str + " in",
+                origWord,
+                line,
             )
     else:
         nBeams = None  # unspecified
@@ -1471,7 +1704,12 @@ def write_docs():
                 else:
                     print("")
                 inTable = 1
-            if re.match(r".*[A-Za-z]\)$", shouldType):
+            if (
+                shouldType.endswith(")")
+                and len(shouldType) >= 2
+                and shouldType[-2].isascii()
+                and shouldType[-2].isalpha()
+            ):
                 shouldType, note = shouldType.rsplit("(", 1)
                 note = " (" + note
             else:
@@ -1501,6 +1739,73 @@ def write_docs():
         print("</table>")
 
 
+# Precompiled merge_lyrics regexes
+_UNDERSCORE_BEFORE_RE = re.compile(r"(?<!\s)_")
+_UNDERSCORE_AFTER_RE = re.compile(r"_(?!\s)")
+
+
+def _expand_wstar(line):
+    """
+    Expands each w*n marker into n copies of the character w, as the old
+    (.)\\*(\\d+) callback substitution did but without a Python callback
+    per match.
+    """
+    if "*" not in line:
+        return line
+    out = []
+    i = 0
+    n = len(line)
+    j = line.find("*", 1)  # the star needs a character before it
+    while j != -1:
+        k = j + 1
+        while k < n and line[k].isdecimal():
+            k += 1
+        if k > j + 1 and j > i:  # a count follows and the character
+            out.append(line[i : j - 1])  # before the star is unconsumed
+            out.append(line[j - 1] * int(line[j + 1 : k]))
+            i = k
+            j = line.find("*", max(k, 1))
+        else:
+            j = line.find("*", j + 1)
+    out.append(line[i:])
+    return "".join(out)
+
+
+def _expand_zero_star(part):
+    """
+    Expands whitespace-delimited 0*n markers into n separated rests,
+    matching the old (\\s+)0\\*(\\d+)(\\s+) substitution including its
+    consumption of the trailing whitespace run.
+    """
+    out = []
+    i = 0
+    n = len(part)
+    j = part.find("0*", i)
+    while j != -1:
+        k = j + 2
+        while k < n and part[k].isdecimal():
+            k += 1
+        if (
+            k > j + 2
+            and j > i
+            and part[j - 1].isspace()
+            and k < n
+            and part[k].isspace()
+        ):
+            e = k
+            while e < n and part[e].isspace():
+                e += 1
+            out.append(part[i:j])
+            out.append("0 " * int(part[j + 2 : k]))
+            out.append(part[k:e])
+            i = e
+        j = part.find("0*", max(j + 1, i))
+    out.append(part[i:])
+    return "".join(out)
+_H_LINE_RE = re.compile(r"\s*H:\s*(\d+\.)?(.*)$")
+_PART_SPLIT_RE = re.compile(r"(NextPart|NextScore)")
+
+
 def merge_lyrics(content):
     """
     Merge lines starting with "H:(\s*\d+\.)" within each part of content,
@@ -1518,51 +1823,47 @@ def merge_lyrics(content):
     def process_part(part):
         def process_line(line):
             # Replace 'w*n' pattern with n copies of w and space '_'
-            line = re.sub(
-                r"(.)\*(\d+)", lambda m: "".join([m.group(1)] * int(m.group(2))), line
-            )
-            line = re.sub(r"(?<!\s)_", " _", line)
-            line = re.sub(r"_(?!\s)", "_ ", line)
+            line = _expand_wstar(line)
+            line = _UNDERSCORE_BEFORE_RE.sub(" _", line)
+            line = _UNDERSCORE_AFTER_RE.sub("_ ", line)
             return line
 
-        # Standardize "H:" lines to "H:1."
-        part = re.sub(r"^\s*H:(?!\s*\d+\.)", "H:1.", part, flags=re.MULTILINE)
-
-        # Extract unique H: \d+ prefixes in order
-        prefixes = re.findall(r"^\s*H:\s*(\d+\.)?", part, flags=re.MULTILINE)
-        prefixes = list(dict.fromkeys(prefixes))  # Remove duplicates
-        prefixes.sort(key=lambda prefix: -1 if prefix == "" else int(prefix[:-1]))
-
-        for prefix in prefixes:
-            # Merge lines with the same prefix
-            label = rf"H:\s*{re.escape(prefix)}"
-            h_lines = re.findall(rf"^\s*{label}(.*)$", part, re.MULTILINE)
-            h_lines = [line.strip() for line in h_lines]
-            merged_line = "H:" + process_line(" ".join(h_lines))
-
-            def replace_first_H(match):
-                replace_first_H.first_encountered = True
-                return merged_line + "\n"
-
-            replace_first_H.first_encountered = False
-            part = re.sub(
-                r"^\s*" + label + ".*(\n|$)",
-                lambda m: replace_first_H(m)
-                if not replace_first_H.first_encountered
-                else "",
-                part,
-                flags=re.MULTILINE,
-            )
+        # Group H: lines by verse prefix in one pass over the lines; each
+        # group is merged into a single line at its first occurrence
+        lines = part.split("\n")
+        out = []
+        bodies = {}  # prefix -> list of lyric bodies, in line order
+        slot = {}  # prefix -> index in out of the merged line
+        last_was_h = False
+        for line in lines:
+            m = _H_LINE_RE.match(line)
+            if not m:
+                out.append(line)
+                last_was_h = False
+                continue
+            # the old multiline regexes swallowed any run of blank lines
+            # immediately before an H: line; do the same
+            while out and out[-1] is not None and not out[-1].strip():
+                out.pop()
+            prefix = m.group(1) or "1."  # plain "H:" lines count as verse 1
+            body = m.group(2).strip()
+            if prefix in bodies:
+                bodies[prefix].append(body)
+            else:
+                bodies[prefix] = [body]
+                slot[prefix] = len(out)
+                out.append(None)  # placeholder, filled in below
+            last_was_h = True
+        for prefix, h_lines in bodies.items():
+            out[slot[prefix]] = "H:" + process_line(" ".join(h_lines))
+        if last_was_h:
+            out.append("")  # the old regexes left a newline after H: lines
+        part = "\n".join(out)
 
         # Replace '0*n' with separated 0s within the part
-        part = re.sub(
-            r"(\s+)0\*(\d+)(\s+)",
-            lambda m: m.group(1) + ("".join(["0 "] * int(m.group(2)))) + m.group(3),
-            part,
-        )
-        return part
+        return _expand_zero_star(part)
 
-    parts = re.split(r"(NextPart|NextScore)", content)
+    parts = _PART_SPLIT_RE.split(content)
     processed_parts = []
 
     for i in range(0, len(parts), 2):
@@ -1573,6 +1874,25 @@ def merge_lyrics(content):
     return "".join(processed_parts).strip()
 
 
+# The Mac file-chooser helper can't appear mid-run, so stat it once
+_HAS_OSASCRIPT = os.path.exists("/usr/bin/osascript")
+
+
+def _read_utf8(f):
+    """
+    Reads a whole file in binary mode and decodes it as UTF-8 in one shot,
+    stripping any leading byte-order mark.  Falls back to the locale
+    encoding if the file is not valid UTF-8.
+    """
+    with open(f, "rb") as fh:
+        data = fh.read()
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        text = data.decode(locale.getpreferredencoding(False))
+    return text.lstrip("\ufeff")
+
+
 def getInput0(f, is_google_drive=False):
     """
     This function reads input data from a file or from standard input. If the
@@ -1589,18 +1909,19 @@ def getInput0(f, is_google_drive=False):
         inDat.append(merge_lyrics(f))
     else:
         try:
-            inDat.append(merge_lyrics(open(f, encoding="utf-8").read()))
+            inDat.append(merge_lyrics(_read_utf8(f)))
         except IOError:
             errExit("Unable to read file " + f)
 
     if inDat:
         return inDat
     if not sys.stdin.isatty():
-        return [fix_utf8(sys.stdin, "r").read()]
+        # whole-buffer read + single decode, regardless of system locale
+        return [sys.stdin.buffer.read().decode("utf-8")]
     # They didn't give us any input.  Try to use a
     # file chooser.  If that fails, just print the
     # help text.
-    if os.path.exists("/usr/bin/osascript"):
+    if _HAS_OSASCRIPT:
         f = (
             os.popen(
                 "osascript -e $'tell application \"System Events\"\nactivate\nset f to choose file\nend tell\nPOSIX path of f'"
@@ -1609,10 +1930,7 @@ def getInput0(f, is_google_drive=False):
             .rstrip()
         )
         if f:
-            try:
-                return [open(f, encoding="utf-8").read()]
-            except:
-                return [open(f).read()]
+            return [_read_utf8(f)]
     sys.stderr.write(__doc__)
     raise SystemExit
 
@@ -1628,36 +1946,21 @@ def get_input(infile, is_google_drive=False):
     Returns:
         str: The input data as a string.
     """
-    inDat = getInput0(infile, is_google_drive)
+    inDat = [d.lstrip("\ufeff") for d in getInput0(infile, is_google_drive)]
 
-    for i in range(len(inDat)):
-        if inDat[i].startswith("\xef\xbb\xbf"):
-            inDat[i] = inDat[i][3:]
-        if inDat[i].startswith(r"\version"):
-            errExit(
-                "jianpu-ly does not READ Lilypond code.\nPlease see the instructions."
-            )
+    if any(d.startswith(r"\version") for d in inDat):
+        errExit("jianpu-ly does not READ Lilypond code.\nPlease see the instructions.")
 
     return " NextScore ".join(inDat)
 
 
-def fix_utf8(stream, mode):
-    """
-    Fixes the encoding of the given stream to UTF-8, regardless of the system locale.
-
-    Args:
-        stream: The stream to fix the encoding for.
-        mode: The mode in which the stream is opened ("r" for reading, "w" for writing, etc.).
-
-    Returns:
-        The stream with the fixed encoding.
-    """
-    # Python 3: please use UTF-8 for Lilypond, even if the system locale says something else
-    import codecs
-    if mode == "r":
-        return codecs.getreader("utf-8")(stream.buffer)
-    else:
-        return codecs.getwriter("utf-8")(stream.buffer)
+# Fullwidth forms map to ASCII by a fixed offset; built once so
+# fix_fullwidth is a single C-level translate pass
+_FULLWIDTH_TABLE = {cp: cp - 0xFEE0 for cp in range(0xFF01, 0xFF5F)}
+_FULLWIDTH_TABLE[0x201A] = ord(",")  # sometimes used as comma (incorrectly)
+_FULLWIDTH_TABLE[0xFF61] = ord(".")
+# Quick probe so pure-ASCII input (the common case) skips the translate pass
+_FULLWIDTH_PROBE_RE = re.compile("[\uFF01-\uFF5E\u201A\uFF61]")
 
 
 def fix_fullwidth(t):
@@ -1670,19 +1973,21 @@ def fix_fullwidth(t):
     Returns:
     str: The processed string with fullwidth characters replaced by their ASCII equivalents.
     """
-    utext = t
-    r = []
-    for c in utext:
-        if 0xFF01 <= ord(c) <= 0xFF5E:
-            r.append(chr(ord(c) - 0xFEE0))
-        elif c == "\u201a":
-            r.append(",")  # sometimes used as comma (incorrectly)
-        elif c == "\uff61":
-            r.append(".")
-        else:
-            r.append(c)
-    utext = "".join(r)
-    return utext
+    if t.isascii():
+        return t  # O(1) flag check; ASCII text has nothing to convert
+    if not _FULLWIDTH_PROBE_RE.search(t):
+        return t  # non-ASCII but no fullwidth chars either
+    return t.translate(_FULLWIDTH_TABLE)
+
+
+# Fixed fragments of the grace-note markup, kept at module scope so each
+# call only concatenates
+_GRACE_HEADER_BEFORE = (
+    "^\\tweak outside-staff-priority ##f ^\\tweak avoid-slur #'inside ^\\markup \\"
+)
+_GRACE_HEADER_MID = r" { \line { "
+_GRACE_SHARP = r"\fontsize #-4 { \raise #0.6 { \sharp } }"
+_GRACE_FLAT = r"\fontsize #-4 { \raise #0.4 { \flat } }"
 
 
 def graceNotes_markup(notes, isAfter):
@@ -1704,46 +2009,41 @@ def graceNotes_markup(notes, isAfter):
     afternext = None
     thinspace = "\u2009"
     notes = grace_octave_fix(notes)
-    for i in range(len(notes)):
-        n = notes[i]
+    # Run-length pairs: octave marks only care whether the run is doubled,
+    # while other characters are emitted once per occurrence.
+    for n, run in ((k, sum(1 for _ in g)) for k, g in itertools.groupby(notes)):
         if n == "#":
-            r.append(r"\fontsize #-4 { \raise #0.6 { \sharp } }")
+            r.extend([_GRACE_SHARP] * run)
         elif n == "b":
-            r.append(r"\fontsize #-4 { \raise #0.4 { \flat } }")
+            r.extend([_GRACE_FLAT] * run)
         elif n == "'":
-            if i and notes[i - 1] == notes[i]:
-                continue
-            if notes[i : i + 2] == "''":
-                above = ":"
-            else:
-                above = "."
+            above = ":" if run >= 2 else "."
             r.append(
                 r"\override #'(direction . 1) \override #'(baseline-skip . 1.2) \dir-column { \line {"
             )
             afternext = r"} \line { " + '"' + thinspace + above + '" } }'
         elif n == ",":
-            if i and notes[i - 1] == notes[i]:
-                continue
-            if notes[i : i + 2] == ",,":
-                below = ":"
-            else:
-                below = "."
+            below = ":" if run >= 2 else "."
             r.append(r"\override #'(baseline-skip . 1.0) \center-column { \line { ")
             afternext = (
                 r"} \line { \pad-to-box #'(0 . 0) #'(-0.2 . 0) " + '"' + below + '" } }'
             )
         else:
-            if r and r[-1].endswith('"'):
-                r[-1] = r[-1][:-1] + n + '"'
-            else:
-                r.append(f'"{n}"')
-            if afternext:
-                r.append(afternext)
-                afternext = None
-    return (
-        r"^\tweak outside-staff-priority ##f ^\tweak avoid-slur #'inside ^\markup \%s { \line { %s } }"
-        % (cmd, " ".join(r))
-    )
+            for _ in range(run):
+                if r and r[-1].endswith('"'):
+                    r[-1] = r[-1][:-1] + n + '"'
+                else:
+                    r.append(f'"{n}"')
+                if afternext:
+                    r.append(afternext)
+                    afternext = None
+    return f"{_GRACE_HEADER_BEFORE}{cmd}{_GRACE_HEADER_MID}{' '.join(r)} }} }}"
+
+
+# Patterns/table for grace_octave_fix, compiled once per import
+_GRACE_APOS_RE = re.compile(r"([1-9])(')+")
+_GRACE_COMMA_RE = re.compile(r"([1-9])(,)+")
+_GRACE_89_TBL = {ord("8"): "'1", ord("9"): "'2"}
 
 
 def grace_octave_fix(notes):
@@ -1760,13 +2060,12 @@ def grace_octave_fix(notes):
     """
 
     # Move '+ and ,+ to before the preceding number
-    notes = re.sub(r"([1-9])(')+", r"\2\1", notes)
-    notes = re.sub(r"([1-9])(,)+", r"\2\1", notes)
+    notes = _GRACE_APOS_RE.sub(r"\2\1", notes)
+    notes = _GRACE_COMMA_RE.sub(r"\2\1", notes)
 
-    # Replacing 8 and 9 with the respective higher octave notes
-    notes = notes.replace("8", "'1").replace("9", "'2")
-
-    return notes
+    # Replacing 8 and 9 with the respective higher octave notes,
+    # both in one translate pass
+    return notes.translate(_GRACE_89_TBL)
 
 
 def gracenotes_western(notes):
@@ -1786,36 +2085,112 @@ def gracenotes_western(notes):
     nextAcc = ""
     next8ve = "'"
     r = []
-    for i in range(len(notes)):
-        n = notes[i]
+    for n, run in ((k, sum(1 for _ in g)) for k, g in itertools.groupby(notes)):
         if n == "#":
             nextAcc = "is"
         elif n == "b":
             nextAcc = "es"
         elif n == "'":
-            if i and notes[i - 1] == notes[i]:
-                continue
-            if notes[i : i + 2] == "''":
-                next8ve = "'''"
-            else:
-                next8ve = "''"
+            next8ve = "'''" if run >= 2 else "''"
         elif n == ",":
-            if i and notes[i - 1] == notes[i]:
-                continue
-            if notes[i : i + 2] == ",,":
-                next8ve = ","
-            else:
-                next8ve = ""
+            next8ve = "," if run >= 2 else ""
         else:
-            if n not in placeholders:
+            ph = _PH_LUT[ord(n)] if ord(n) < 256 else 0
+            if not ph:
                 continue  # TODO: errExit ?
-            r.append(placeholders[n] + nextAcc + next8ve + "16")
-            nextAcc = ""
-            next8ve = "'"
+            for _ in range(run):
+                r.append(chr(ph) + nextAcc + next8ve + "16")
+                nextAcc = ""
+                next8ve = "'"
 
     return " ".join(r)
 
 
+# Patterns for convert_ties_to_slurs/reformat_slurs, compiled once.
+_COMMENT_RE = re.compile(r"%.*$", re.MULTILINE)
+
+
+def strip_comments(s):
+    """Removes % comments (to end of line) from the score text."""
+    return _COMMENT_RE.sub("", s)
+# Matches an entire tied note sequence inside a slur
+_TIED_SEQ_RE = re.compile(r"(?<!\\)\([^()]*~[^()]*\)(?<!\\)")
+# Pattern parts:
+# Building blocks for locating tied note runs.  These are matched one at
+# a time by the linear scanner below rather than via one big nested
+# regex, which was prone to heavy backtracking on long tied sequences.
+_NOTE_RE = re.compile(
+    r"[qshb]?(?:[1-7][',]*)+\.?"  # optional modifier [qshb], digits 1-7 with octave marks, optional dot
+)
+_ANNOTATION_RE = re.compile(r'\s*[\^_]"[^"]*"')  # annotation with leading spaces
+_DASH_RE = re.compile(r"\s+-")  # a space followed by a dash
+_TIE_RE = re.compile(r"\s+~\s+")  # a tie symbol with spaces before and after
+_TIMESIG_RE = re.compile(r"\s*\d+/\d+\s*")
+_RUN_START_RE = re.compile(r"[qshb1-7]")  # first char of any note
+# Splits on ties; the first branch stops short of a newline that leads
+# into a time signature so the signature keeps its own line
+_TIE_SPLIT_RE = re.compile(r"~[^\S\n]*(?=\n\s*\d+/\d+)|~\s*")
+_MULTISPACE_RE = re.compile(r"[ \t\f\v]{2,}")
+# Move parenthesis before/after dashes
+_PAREN_BEFORE_DASH_RE = re.compile(
+    r'((?:(?:\s+-)(?:\s+[\^_]"[^"]*")*' + r")+)(\s+[\(\)])"
+)
+_DASH_AFTER_PAREN_RE = re.compile(
+    r'(\s+[\(\)])((?:(?:\s+-)(?:\s+[\^_]"[^"]*")*' + r")+)"
+)
+# Matches a syllable dash to expand, or an already-expanded " -- ";
+# both are rewritten to " --\n" in one pass
+_LYRIC_DASH_RE = re.compile("(?<=[^- ])- | -- ")
+# Splits lyric text around hanzi and opening quotes for spacing fixes
+_HANZI_SPLIT_RE = re.compile("([\u3400-\uA6FF\u2018\u201C\u300A])")
+_OPENQUOTES = frozenset("\u2018\u201C\u300A")
+
+
+def _skip_annotations(text, p):
+    """Advances p over any run of annotation tokens."""
+    while True:
+        m = _ANNOTATION_RE.match(text, p)
+        if not m:
+            return p
+        p = m.end()
+
+
+def _skip_dashes_and_annotations(text, p):
+    """Advances p over any run of dashes, each with optional annotations."""
+    while True:
+        m = _DASH_RE.match(text, p)
+        if not m:
+            return p
+        p = _skip_annotations(text, m.end())
+
+
+def _match_tie_run(text, pos):
+    """
+    Matches a tied note run starting at pos: a note (with annotations and
+    dashes) followed by one or more tie + note units, each optionally led
+    by a time signature.  Returns the end index, or None if there is no
+    tie at pos.
+    """
+    m = _NOTE_RE.match(text, pos)
+    if not m:
+        return None
+    p = _skip_dashes_and_annotations(text, _skip_annotations(text, m.end()))
+    end = None
+    while True:
+        mt = _TIE_RE.match(text, p)
+        if not mt:
+            return end
+        q = mt.end()
+        mts = _TIMESIG_RE.match(text, q)
+        mn = _NOTE_RE.match(text, mts.end()) if mts else None
+        if not mn:  # no time signature (or nothing tieable after one)
+            mn = _NOTE_RE.match(text, q)
+            if not mn:
+                return end
+        p = _skip_dashes_and_annotations(text, _skip_annotations(text, mn.end()))
+        end = p
+
+
 def convert_ties_to_slurs(jianpu):
     """
     Convert tied notes in Jianpu notation to slurs.
@@ -1826,81 +2201,50 @@ def convert_ties_to_slurs(jianpu):
     Returns:
         str: The Jianpu notation with ties converted to slurs. Time signatures
              following ties are handled properly, preserving their placement.
+        The caller is expected to have removed % comments already (see
+        strip_comments).
     """
-    # Remove comments from the input
-    jianpu = re.sub(r"%.*$", "", jianpu, flags=re.MULTILINE)
-
-    # Define the pattern to match the entire tied note sequence
-    tied_note_sequence_pattern = r"(?<!\\)\([^()]*~[^()]*\)(?<!\\)"
-
     # protect ties within slurs
     def protect_ties_in_slurs(match):
         return match.group(0).replace("~", "__TIE__")
 
-    jianpu = re.sub(tied_note_sequence_pattern, protect_ties_in_slurs, jianpu)
-
-    # Pattern parts:
-    note_pattern = r"([qshb]?(?:[1-7][',]*)+\.?)"  # Matches a note with optional modifier [qshb], digit 1-7, optional ' or ,, and optional dot.
-    annotation_pattern = (
-        r'(\s*[\^_]"[^"]*")*'  # Matches optional annotations with leading spaces.
-    )
-    dash_pattern = r"(\s+-)"  # Matches a space followed by a dash.
-    tie_pattern = r"(\s+~\s+)"  # Matches a tie symbol with spaces before and after.
-    dash_and_annotation_pattern = (
-        r"(" + dash_pattern + annotation_pattern + ")*"
-    )  # Combines dashes and annotations.
-    time_signature_pattern = r"(\s*\d+/\d+\s*)?"
-
-    # Full combined pattern for sequences of tied notes
-    combined_tie_pattern = (
-        note_pattern
-        + annotation_pattern
-        + dash_and_annotation_pattern
-        + "(?:"  # Use the combined dash and annotation pattern here
-        + tie_pattern
-        + time_signature_pattern
-        + note_pattern  # Include the time signature pattern here, optionally preceded by a newline
-        + annotation_pattern
-        + dash_and_annotation_pattern
-        + ")+"  # And also here
-    )
-
-    # This function will be used as the replacement function in the sub call
-    def slur_replacement(match):
-        # Get the full matched string, preserving newlines
-        matched_string = match.group(0)
-
-        # Replace newlines followed by a time signature to a special token to avoid splitting
-        matched_string = re.sub(r"(\n\s*\d+/\d+\s*)", r"__TIMESIG__\1", matched_string)
+    jianpu = _TIED_SEQ_RE.sub(protect_ties_in_slurs, jianpu)
 
-        # Split the string into its parts using the tie symbol as the delimiter
-        parts = re.split(r"~\s*", matched_string)
-
-        # Replace the special token back to the original time signature
-        parts = [re.sub(r"__TIMESIG__", "", part) for part in parts]
-
-        # Remove trailing whitespace from each part, except for newlines
-        parts = [part.rstrip() for part in parts]
+    def slur_replacement(run):
+        # Split into parts at the tie symbols, preserving newlines before
+        # time signatures, and drop trailing whitespace from each part
+        parts = [part.rstrip() for part in _TIE_SPLIT_RE.split(run)]
 
         # Construct the slur by wrapping all but the first part in parentheses
         slur_content = parts[0] + " ( " + " ".join(parts[1:]) + " )"
 
         # Ensure we don't have multiple spaces in a row, but preserve newlines
-        slur_content = re.sub(r"[ \t\f\v]{2,}", " ", slur_content)
+        slur_content = _MULTISPACE_RE.sub(" ", slur_content)
 
         # Move parenthesis before dashes
-        slur_content = re.sub(
-            r'((?:(?:\s+-)(?:\s+[\^_]"[^"]*")*' + r")+)(\s+[\(\)])",
-            r"\2\1",
-            slur_content,
-        )
+        slur_content = _PAREN_BEFORE_DASH_RE.sub(r"\2\1", slur_content)
 
         return slur_content
 
-    # Replace all instances of ties with slurs using the replacement function
-    converted_jianpu = re.sub(combined_tie_pattern, slur_replacement, jianpu)
+    # Linear scan for tied note runs, rewriting each as a slur
+    out = []
+    pos = 0
+    while True:
+        m = _RUN_START_RE.search(jianpu, pos)
+        if not m:
+            break
+        i = m.start()
+        end = _match_tie_run(jianpu, i)
+        if end is None:
+            out.append(jianpu[pos : i + 1])
+            pos = i + 1
+        else:
+            out.append(jianpu[pos:i])
+            out.append(slur_replacement(jianpu[i:end]))
+            pos = end
+    out.append(jianpu[pos:])
 
-    return converted_jianpu.strip().replace("__TIE__", "~")
+    return "".join(out).strip().replace("__TIE__", "~")
 
 
 def reformat_slurs(jianpu):
@@ -1918,20 +2262,14 @@ def reformat_slurs(jianpu):
     Returns:
         str: The Jianpu notation string with slurs reformatted.
 
-    The function first removes any comments from the Jianpu string. Then, it searches for
-    patterns where a slur parenthesis precedes a dash and rearranges them so that the
-    parenthesis follows the dash. This reformatting aids in the visual clarity and
-    correctness of the notation.
+    The function searches for patterns where a slur parenthesis precedes a dash
+    and rearranges them so that the parenthesis follows the dash. This
+    reformatting aids in the visual clarity and correctness of the notation.
+    The caller is expected to have removed % comments already (see
+    strip_comments).
     """
-    # Remove comments from the input
-    jianpu = re.sub(r"%.*$", "", jianpu, flags=re.MULTILINE)
-
     # Move opening and closing parenthesis after dashes
-    return re.sub(
-        r'(\s+[\(\)])((?:(?:\s+-)(?:\s+[\^_]"[^"]*")*' + r")+)",
-        r"\2\1",
-        jianpu,
-    )
+    return _DASH_AFTER_PAREN_RE.sub(r"\2\1", jianpu)
 
 
 def process_lyrics_line(line, do_hanzi_spacing):
@@ -1945,12 +2283,9 @@ def process_lyrics_line(line, do_hanzi_spacing):
     Returns:
     str: The processed lyrics line.
     """
+    line = as_unicode(line)  # (no-op for str; decodes any bytes input once)
     toAdd = ""
-    if (
-        line
-        and "1" <= line[0] <= "9"
-        and (line[1] == "." or as_unicode(line)[1] == "\uff0e")
-    ):
+    if line and "1" <= line[0] <= "9" and (line[1] == "." or line[1] == "\uff0e"):
         # a verse number
         toAdd = fr'\set stanza = #"{line[:1]}." '
         line = line[2:].strip()
@@ -1962,33 +2297,35 @@ def process_lyrics_line(line, do_hanzi_spacing):
         if toAdd:
             l2.append(toAdd)
             toAdd = ""
-        needSpace = 0
-        for c in list(as_unicode(line)):
-            # TODO: also cover those outside the BMP?  but beware narrow Python builds
-            is_hanzi = 0x3400 <= ord(c) < 0xA700
-            is_openquote = c in "\u2018\u201c\u300A"
-            if needSpace and (is_hanzi or is_openquote):
-                l2.append(" ")
-                needSpace = 0
+        # One C-level split around hanzi/opening quotes, then walk the
+        # alternating plain/special tokens instead of every character.
+        # TODO: also cover those outside the BMP?  but beware narrow Python builds
+        tokens = _HANZI_SPLIT_RE.split(line)
+        needSpace = False
+        append = l2.append  # bind once; this loop runs per lyric char group
+        for i, tok in enumerate(tokens):
+            if i % 2 == 0:  # plain text between hanzi/quotes
+                if "-" in tok:
+                    # TODO: document this: separate hanzi with - to put more than one on same note
+                    needSpace = False
+                    tok = tok.replace("-", "")
+                append(tok)
+                continue
+            is_openquote = tok in _OPENQUOTES
+            if needSpace:
+                append(" ")
                 if is_openquote:  # hang left
                     # or RIGHT if there's no punctuation after
-                    l2.append(
+                    append(
                         r"\once \override LyricText #'self-alignment-X = #CENTER "
                     )
-            if is_hanzi:
-                needSpace = 1
-            if c == "-":
-                needSpace = 0  # TODO: document this: separate hanzi with - to put more than one on same note
-            else:
-                l2.append(c)
+            needSpace = not is_openquote
+            append(tok)
         line = "".join(l2)
 
     # Replace certain characters and encode as needed, and
     # prepare the lyrics line with or without verse numbers.
-    processed_lyrics = toAdd + re.sub("(?<=[^- ])- ", " -- ", line).replace(
-        " -- ", " --\n"
-    )
-    return processed_lyrics
+    return toAdd + _LYRIC_DASH_RE.sub(" --\n", line)
 
 
 def process_headers_line(line, headers):
@@ -2036,7 +2373,7 @@ def process_key_signature(word, out, midi, western, inTranspose, notehead_markup
 
     # Convert '#' and 'b' to Unicode for approximation display
     unicode_repr = (
-        re.sub("(?<!=)b$", "\u266d", word.replace("#", "\u266f")).upper() + " "
+        _KEY_FLAT_RE.sub("\u266d", word.replace("#", "\u266f")).upper() + " "
     )
     notehead_markup.unicode_approx.append(unicode_repr)
 
@@ -2065,6 +2402,22 @@ def process_key_signature(word, out, midi, western, inTranspose, notehead_markup
     return inTranspose
 
 
+# Mapping from textual fingering representation to Unicode character,
+# built once at import rather than per call
+_FINGER_TO_UNICODE = {
+    "1": "\u4e00",  # Chinese numeral 1
+    "2": "\u4c8c",  # Chinese numeral 2
+    "3": "\u4e09",  # Chinese numeral 3
+    "4": "\u56db",  # Chinese numeral 4
+    "souyin": "\u4e45",  # Symbol for Souyin
+    "harmonic": "\u25cb",  # White circle symbol for harmonic
+    "up": "\u2197",  # NE arrow
+    "down": "\u2198",  # SE arrow
+    "bend": "\u293b",  # Bottom arc anticlockwise arrow
+    "tilde": "\u223c",  # Full-width tilde
+}
+
+
 def process_fingering(word, out):
     """
     Extracts the fingering from the word and maps it to a Unicode character.
@@ -2077,26 +2430,9 @@ def process_fingering(word, out):
     Returns:
     None
     """
-    # Extract the fingering from the word
-    finger = word.split("=")[1]
-    # Mapping from textual representation to Unicode character
-    finger_to_unicode = {
-        "1": "\u4e00",  # Chinese numeral 1
-        "2": "\u4c8c",  # Chinese numeral 2
-        "3": "\u4e09",  # Chinese numeral 3
-        "4": "\u56db",  # Chinese numeral 4
-        "souyin": "\u4e45",  # Symbol for Souyin
-        "harmonic": "\u25cb",  # White circle symbol for harmonic
-        "up": "\u2197",  # NE arrow
-        "down": "\u2198",  # SE arrow
-        "bend": "\u293b",  # Bottom arc anticlockwise arrow
-        "tilde": "\u223c",  # Full-width tilde
-    }
-    # Get the Unicode character for the fingering, defaulting to the original string
-    finger_unicode = finger_to_unicode.get(finger, finger)
-
-    # Append the LilyPond finger notation command
-    out.append(fr'\finger "{finger_unicode}"')
+    # Extract the fingering, defaulting to the original string if unmapped
+    finger = word.split("=", 1)[1]
+    out.append(fr'\finger "{_FINGER_TO_UNICODE.get(finger, finger)}"')
 
 
 def process_time_signature(word, out, notehead_markup, midi):
@@ -2217,9 +2553,14 @@ def process_note(
     if b4last:
         out[lastPtr] = b4last + out[lastPtr]
 
-    # If there's any markup after the last note, insert it after the last note in the output
+    # If there's any markup after the last note, insert it after the last note
+    # in the output (plain append when the last note is still at the tail,
+    # which is the common case)
     if aftrlast:
-        out.insert(lastPtr + 1, aftrlast)
+        if lastPtr + 1 == len(out):
+            out.append(aftrlast)
+        else:
+            out.insert(lastPtr + 1, aftrlast)
 
     # Update the pointer to the last note
     lastPtr = len(out)
@@ -2351,7 +2692,10 @@ def process_grace_notes_after(
         # Handle grace notes for Jianpu notation:
         if not notehead_markup.withStaff:
             out[lastPtr] = r"\once \textLengthOn " + out[lastPtr]
-        out.insert(lastPtr + 1, graceNotes_markup(gracenote_content, 1))
+        if lastPtr + 1 == len(out):
+            out.append(graceNotes_markup(gracenote_content, 1))
+        else:
+            out.insert(lastPtr + 1, graceNotes_markup(gracenote_content, 1))
         if not defined_JGR:
             defined_JGR = True
             out[lastPtr] = (
@@ -2383,6 +2727,80 @@ def process_grace_notes_after(
     return defined_JGR
 
 
+# Tied-note shapes for collapse_tied_notes, longest first so the fused
+# alternation below keeps the same precedence as applying them in order.
+# A result of None marks a tremolo-only shape: the duration has no
+# single-note (or rest) equivalent, but a tremolo just multiplies its
+# repeat count.
+_COLLAPSE_NOTE_PATTERNS = [
+    (4, r"\.", "1."),  # in 12/8, 4 dotted crotchets = dotted semibreve
+    (3, r"\.", None),  # in 9/8, 3 dotted crotchets (tremolo only)
+    (4, "", "1"),  # 4 crotchets = semibreve
+    (3, "", "2."),  # 3 crotchets = dotted minim
+    (2, r"\.", "2."),  # in 6/8, 2 dotted crotchets = dotted minim
+    (2, "", "2"),  # 2 crotchets = minim
+]
+
+
+def _build_collapse_re():
+    # One alternation covering every (note, tremolo, rest) shape, so the
+    # score is scanned once instead of once per pattern.  Group names are
+    # prefixed per alternative ("p0n" etc.) because each needs its own
+    # backreference.
+    alts = []
+    dispatch = {}
+    for i, (numNotes, dot, result) in enumerate(_COLLAPSE_NOTE_PATTERNS):
+        if result is not None:
+            tail = " +~ ".join([r"(?P=p%dn)4%s" % (i, dot)] * (numNotes - 1))
+            alts.append(
+                r"(?P<p%d>(?P<p%dn>[^<][^ ]*|<[^>]*>)4%s(?P<p%ds>(?::32)?) +~(?P<p%dd>( \\[^ ]+)*) %s)"
+                % (i, i, dot, i, i, tail)
+            )
+            dispatch["p%d" % i] = ("note", i, numNotes, dot, result)
+        tail = " +~ ".join([r"< (?P=t%da) (?P=t%db) >4%s" % (i, i, dot)] * (numNotes - 1))
+        alts.append(
+            r"(?P<t%d>\\repeat tremolo %d { (?P<t%da>[^ ]+)32 (?P<t%db>[^ ]+)32 } +~(?P<t%dd>( \\[^ ]+)*) %s)"
+            % (i, 4 if not dot else 6, i, i, i, tail)
+        )
+        dispatch["t%d" % i] = ("tremolo", i, numNotes, dot, result)
+        if result is not None:
+            alts.append(
+                r"(?P<r%d>%s)" % (i, re.escape(" ".join([r"r4" + dot] * numNotes)))
+            )
+            dispatch["r%d" % i] = ("rest", i, numNotes, dot, result)
+    return re.compile("|".join(alts)), dispatch
+
+
+_COLLAPSE_RE, _COLLAPSE_DISPATCH = _build_collapse_re()
+# Dynamics should be attached inside the tremolo.  Only genuine dynamic
+# commands may be pulled in: anything else that can follow a note
+# (\time, \mark, \tempo, \bar, ...) must stay outside the braces.
+_TREMOLO_DYN_RE = re.compile(
+    r"(\\repeat tremolo [^{]+{ [^ ]+)( [^}]+ })"
+    r"((?: +\\(?:[mrs]?[pf]{1,4}z?|[<>!]|cresc|decresc|dim|espressivo)(?=\s|$))+)"
+)
+_BAR_REST_RE = re.compile(r"(%\{ bar [0-9]*: %\} )r([^ ]* \\bar)")
+
+
+def _collapse_repl(m):
+    for name, (kind, i, numNotes, dot, result) in _COLLAPSE_DISPATCH.items():
+        if m.group(name) is None:
+            continue
+        if kind == "note":
+            return m.group("p%dn" % i) + result + m.group("p%ds" % i) + m.group(
+                "p%dd" % i
+            )
+        if kind == "tremolo":
+            return r"\repeat tremolo %d { %s32 %s32 }%s" % (
+                (4 if not dot else 6) * numNotes,
+                m.group("t%da" % i),
+                m.group("t%db" % i),
+                m.group("t%dd" % i),
+            )
+        return "r" + result
+    return m.group(0)  # unreachable: exactly one alternative matched
+
+
 def collapse_tied_notes(out):
     """
     Collapse sequences of tied notes into longer ones in the given LilyPond code.
@@ -2400,52 +2818,18 @@ def collapse_tied_notes(out):
     a consistent look throughout the score and adjusts bar checks for accurate
     measure counting.
     """
-    # Patterns for converting sequences of tied notes into longer notes
-    note_patterns = [
-        (4, r"\.", "1."),  # in 12/8, 4 dotted crotchets = dotted semibreve
-        (4, "", "1"),  # 4 crotchets = semibreve
-        (3, "", "2."),  # 3 crotchets = dotted minim
-        (2, r"\.", "2."),  # in 6/8, 2 dotted crotchets = dotted minim
-        (2, "", "2"),  # 2 crotchets = minim
-    ]
-
-    # Use regular expressions to match tied note patterns and
-    # replace them with the corresponding long note.
-    for numNotes, dot, result in note_patterns:
-        # Define regex pattern for tied notes.
-        tied_note_pattern = (
-            r"(?P<note>[^<][^ ]*|<[^>]*>)4"
-            + dot
-            + r"((?::32)?) +~(( \\[^ ]+)*) "
-            + " +~ ".join([r"(?P=note)4" + dot] * (numNotes - 1))
-        )
-        out = re.sub(tied_note_pattern, r"\g<note>" + result + r"\g<2>\g<3>", out)
-
-        tremolo_pattern = (
-            r"\\repeat tremolo "
-            + str(4 if not dot else 6)
-            + r" { (?P<note1>[^ ]+)32 (?P<note2>[^ ]+)32 } +~(( \\[^ ]+)*) "
-            + " +~ ".join([r"< (?P=note1) (?P=note2) >4" + dot] * (numNotes - 1))
-        )
-        out = re.sub(
-            tremolo_pattern,
-            r"\\repeat tremolo "
-            + str(4 * numNotes if not dot else 6 * numNotes)
-            + r" { \g<note1>32 \g<note2>32 }\g<3>",
-            out,
-        )
-
-        out = out.replace(" ".join([r"r4" + dot] * numNotes), "r" + result)
+    # One pass over the score: the fused alternation matches every tied
+    # note, tied tremolo and rest-run shape, dispatching on which
+    # alternative matched.  Every alternative needs a tie or a crotchet
+    # rest, so skip the scan when neither can occur.
+    if "~" in out or "r4" in out:
+        out = _COLLAPSE_RE.sub(_collapse_repl, out)
 
     # Dynamics should be attached inside the tremolo, except for '\bar'.
-    out = re.sub(
-        r"(\\repeat tremolo [^{]+{ [^ ]+)( [^}]+ })(( +\\[^b][^ ]*)+)",
-        r"\g<1>\g<3>\g<2>",
-        out,
-    )
+    out = _TREMOLO_DYN_RE.sub(r"\g<1>\g<3>\g<2>", out)
 
     # Replace placeholders with actual bar numbers.
-    out = re.sub(r"(%\{ bar [0-9]*: %\} )r([^ ]* \\bar)", r"\g<1>R\g<2>", out)
+    out = _BAR_REST_RE.sub(r"\g<1>R\g<2>", out)
 
     # Adjust staff spacing for consistent look across the entire score.
     out = out.replace(
@@ -2458,6 +2842,63 @@ def collapse_tied_notes(out):
     return out
 
 
+# Patterns for finalize_output and getLY's per-line/per-word dispatch,
+# compiled once instead of per call
+_LONG_NOTE_BREAK_RE = re.compile(r"([a-g]+[',]*)4\s*~\s*\(\s*([a-g]+[',]*)2\.")
+
+
+def _long_note_break_repl(m):
+    return m.group(1) + "1 (" if m.group(1) == m.group(2) else m.group(0)
+
+
+
+# Fixed-string rewrites applied to the finished score in one scan; the
+# bold-markup one only applies in numeric (angka) mode
+_FINALIZE_SUBS = {
+    "make-bold-markup": "make-simple-markup",
+    r"\breathe": r"\tweak Y-offset #1 \breathe",
+}
+
+
+@functools.lru_cache(maxsize=2)
+def _finalize_literal_re(include_bold):
+    keys = [k for k in _FINALIZE_SUBS if include_bold or k != "make-bold-markup"]
+    return re.compile("|".join(re.escape(k) for k in keys))
+
+
+def _finalize_literal_repl(m):
+    return _FINALIZE_SUBS[m.group(0)]
+_TEMPO_COMMENT_RE = re.compile(r"^%%\s*tempo:\s*(\S+)\s*$")
+_HEADER_LINE_RE = re.compile(r"\s*[A-Za-z]+\s*=")
+# A word is either a quoted multi-word text markup (spaces kept inside) or
+# a plain whitespace-delimited token, so no sentinel encoding is needed.
+_TOKEN_RE = re.compile('[_^]"[^" ]* [^"]*"(?= |$)|\\S+')
+_PAT_TEMPO = re.compile("[1-468]+[.]*=[1-9][0-9]*$")
+_PAT_KEY = re.compile("[16]=[A-Ga-g][#b]?$")
+_PAT_LETTER = re.compile("letter[A-Z]$")
+_PAT_RMULT = re.compile(r"R\*[1-9][0-9\/]*$")
+_PAT_TIMESIG_WORD = re.compile("[1-9][0-9]*/[1-468]+(,[1-9][0-9]*[.]?)?$")
+_PAT_PERCENT_REPEAT = re.compile("R[1-9][0-9]*{$")
+_PAT_TUPLET = re.compile(r"[1-9][0-9]*\[$")
+_PAT_GRACE = re.compile(r"g\[[#b',1-9\s]+\]$")
+# Characters that can only appear in plain note/rest/dash words: figures,
+# accidentals, octave marks, dots, length letters, beam backslashes.  A
+# word drawn entirely from these (not starting with a backslash, which
+# would be a LilyPond command) can't match any branch of the dispatch
+# cascade in getLY, so it can go straight to process_note.
+_NOTE_WORD_CHARS = frozenset("01234567#b',.qsdhc\\-")
+_PAT_GRACE_AFTER = re.compile(r"\[[#b',1-9]+\]g$")
+_KEY_FLAT_RE = re.compile("(?<!=)b$")
+# Patterns for process_input/get_unicode_approx score splitting
+_UNICODE_WORD_RE = re.compile(r"\sUnicode\s")
+_NEXTSCORE_RE = re.compile(r"\sNextScore\s")
+_NEXTPART_RE = re.compile(r"\sNextPart\s")
+_PARTMIDI_RE = re.compile(r"\sPartMidi\s")
+_LYRICS_TAG_RE = re.compile("(^|\n)[LH]:")
+_ANNOT_CMD_RE = re.compile(r'([\^_])"(\\[^"]+)"')
+_OVERRIDE_DOT_RE = re.compile(r"(\\override [A-Z][^ ]*) #'")
+
+
 def finalize_output(out_list, need_final_barline, midi, western, not_angka):
     """
     Refines the music notation output by making several adjustments.
@@ -2483,59 +2924,114 @@ def finalize_output(out_list, need_final_barline, midi, western, not_angka):
     if need_final_barline and not midi:
         out_list.append(r'\bar "|."')
 
-    # Combine consecutive \mark \markup{} commands into a single command.
-    i = 0
-    while i < len(out_list) - 1:
-        while (
-            i < len(out_list) - 1
-            and out_list[i].startswith(r"\mark \markup{")
-            and out_list[i].endswith("}")
-            and out_list[i + 1].startswith(r"\mark \markup{")
-            and out_list[i + 1].endswith("}")
+    # Combine consecutive \mark \markup{} commands into a single command,
+    # collapsing each run in one forward pass (the old del-in-place loop
+    # shifted the list tail per merge).
+    nbsp = " "  # No need for the encoded non-breaking space, Python 3 defaults to unicode
+    mark_prefix = r"\mark \markup{"
+    merged = []
+    for s in out_list:
+        if (
+            merged
+            and s.startswith(mark_prefix)
+            and s.endswith("}")
+            and merged[-1].startswith(mark_prefix)
+            and merged[-1].endswith("}")
         ):
-            nbsp = " "  # No need for the encoded non-breaking space, Python 3 defaults to unicode
-            out_list[i] = (
-                out_list[i][:-1]
-                + nbsp
-                + " "
-                + out_list[i + 1][len(r"\mark \markup{") :]
-            )
-            del out_list[i + 1]
-        i += 1
-
-    # Ensure that each line ends properly and does not surpass 60 characters.
-    for i in range(len(out_list) - 1):
-        if not out_list[i].endswith("\n"):
-            if "\n" in out_list[i] or len(out_list[i]) > 60:
-                out_list[i] += "\n"
-            else:
-                out_list[i] += " "
+            merged[-1] = merged[-1][:-1] + nbsp + " " + s[len(mark_prefix):]
+        else:
+            merged.append(s)
+    out_list = merged
+
+    # Ensure that each line ends properly and does not surpass 60
+    # characters, folding the terminators into the final join rather
+    # than reallocating each element with +=.
+    last = len(out_list) - 1
+    parts = []
+    for i, s in enumerate(out_list):
+        parts.append(s)
+        if i != last and not s.endswith("\n"):
+            parts.append("\n" if "\n" in s or len(s) > 60 else " ")
 
     # Join all sequences and strings in the output list into a single string.
-    out_str = "".join(out_list)
+    out_str = "".join(parts)
 
     # If we're outputting to MIDI or using Western notation, collapse tied notes.
     if midi or western:
         out_str = collapse_tied_notes(out_str)
 
-    # If we're using numeric notation, change all bold markup commands to simple markup.
-    if not_angka:
-        out_str = out_str.replace("make-bold-markup", "make-simple-markup")
-
-    # Adjust the breaking up of long notes in the musical score.
-    pattern = r"([a-g]+[',]*)4\s*~\s*\(\s*([a-g]+[',]*)2\."
-    out_str = re.sub(
-        pattern,
-        lambda m: m.group(1) + "1 (" if m.group(1) == m.group(2) else m.group(0),
-        out_str,
-    )
+    # Apply the fixed-string rewrites (simple markup in numeric notation,
+    # \breathe Y-offset tweak) in a single scan, skipped when neither
+    # literal is present.
+    if r"\breathe" in out_str or (not_angka and "make-bold-markup" in out_str):
+        out_str = _finalize_literal_re(bool(not_angka)).sub(
+            _finalize_literal_repl, out_str
+        )
 
-    # Replace \breathe with \tweak Y-offset #1 \breathe
-    out_str = out_str.replace(r"\breathe", r"\tweak Y-offset #1 \breathe")
+    # Adjust the breaking up of long notes in the musical score; the
+    # pattern requires a tie, so tie-free scores skip the scan.
+    if "~" in out_str:
+        out_str = _LONG_NOTE_BREAK_RE.sub(_long_note_break_repl, out_str)
 
     return out_str
 
 
+def _dup_warning(word):
+    sys.stderr.write(
+        "WARNING: Duplicate %s, did you miss out a NextScore?\n" % word
+    )
+
+
+def _w_onepage(out):
+    if notehead_markup.onePage:
+        _dup_warning("OnePage")
+    notehead_markup.onePage = 1
+
+
+# TODO: document this.  If this is on, you have to use c in a note to go back to crotchets.
+def _w_keeplength(out):
+    notehead_markup.keepLength = 1
+
+
+def _w_nobarnums(out):
+    if notehead_markup.noBarNums:
+        _dup_warning("NoBarNums")
+    notehead_markup.noBarNums = 1
+
+
+def _w_separatetimesig(out):
+    if notehead_markup.separateTimesig:
+        _dup_warning("SeparateTimesig")
+    notehead_markup.separateTimesig = 1
+    out.append(r"\override Staff.TimeSignature #'stencil = ##f")
+
+
+def _w_angka(out):
+    global not_angka
+    if not_angka:
+        _dup_warning("angka")
+    not_angka = True
+
+
+def _w_noop(out):
+    pass
+
+
+# Single-word score options: one dict lookup replaces a chain of string
+# comparisons in getLY's word loop.
+_WORD_HANDLERS = {
+    "OnePage": _w_onepage,
+    "KeepOctave": _w_noop,  # undocumented option removed in 1.7, no effect
+    "KeepLength": _w_keeplength,
+    "NoBarNums": _w_nobarnums,
+    "SeparateTimesig": _w_separatetimesig,
+    "angka": _w_angka,
+    "Indonesian": _w_angka,
+    "WithStaff": _w_noop,
+    "PartMidi": _w_noop,  # handled in process_input
+}
+
+
 def getLY(score, headers=None, midi=True):
     """
     Transforms a given score into LilyPond format.
@@ -2551,11 +3047,19 @@ def getLY(score, headers=None, midi=True):
                and the dictionary of headers.
     """
 
-    # Check if MIDI output is not being generated
+    global not_angka  # may be set by the angka/Indonesian words below
+
+    # Comments are stripped once here, for whichever rewrite runs below
+    score = strip_comments(score)
+
+    # Check if MIDI output is not being generated.  Either rewrite is a
+    # no-op without its marker character, so a substring test skips the
+    # whole scan for the common tie-free/slur-free scores.
     if not midi:
         # In Jianpu, ties need to be converted into slurs.
-        score = convert_ties_to_slurs(score)
-    else:
+        if "~" in score:
+            score = convert_ties_to_slurs(score)
+    elif "(" in score or ")" in score:
         # In Staff, slurs should not break dashes.
         score = reformat_slurs(score)
 
@@ -2575,8 +3079,9 @@ def getLY(score, headers=None, midi=True):
 
     for line in score.split("\n"):
         line = fix_fullwidth(line).strip()
-        # Upgrade path compatibility for tempo
-        line = re.sub(r"^%%\s*tempo:\s*(\S+)\s*$", r"\1", line)
+        if line.startswith("%%"):
+            # Upgrade path compatibility for tempo
+            line = _TEMPO_COMMENT_RE.sub(r"\1", line)
         if line.startswith("LP:"):
             # Escaped LilyPond block.
             escaping = 1
@@ -2595,85 +3100,57 @@ def getLY(score, headers=None, midi=True):
             line = line[2:].strip()
             processed_lyrics = process_lyrics_line(line, do_hanzi_spacing)
             lyrics.append(processed_lyrics)
-        elif re.match(r"\s*[A-Za-z]+\s*=", line):
+        elif _HEADER_LINE_RE.match(line):
             # Lilypond header
             process_headers_line(line, headers)
         else:
-            line = re.sub(
-                '(?<= )[_^]"[^" ]* [^"]*"(?= |$)',
-                lambda m: m.group().replace(" ", chr(0)),
-                " " + line,
-            )[
-                1:
-            ]  # multi-word text above/below stave
-            for word in line.split():
-                word = word.replace(chr(0), " ")
+            # multi-word text above/below stave stays one token
+            for word in _TOKEN_RE.findall(line):
                 if word in ["souyin", "harmonic", "up", "down", "bend", "tilde"]:
                     word = "Fr=" + word  # (Fr= before these is optional)
                 if word.startswith("%"):
                     break  # a comment
-                elif re.match("[1-468]+[.]*=[1-9][0-9]*$", word):
+                elif word[0] != "\\" and _NOTE_WORD_CHARS.issuperset(word):
+                    # the common case: a plain note word bypasses the
+                    # pattern cascade below (none of it can match)
+                    lastPtr, afternext, need_final_barline, maxBeams = process_note(
+                        word,
+                        out,
+                        notehead_markup,
+                        lastPtr,
+                        afternext,
+                        not_angka,
+                        need_final_barline,
+                        maxBeams,
+                        line,
+                    )
+                elif _PAT_TEMPO.match(word):
                     out.append(r"\tempo " + word)  # TODO: reduce size a little?
-                elif re.match("[16]=[A-Ga-g][#b]?$", word):  # key
+                elif _PAT_KEY.match(word):  # key
                     inTranspose = process_key_signature(
                         word, out, midi, western, inTranspose, notehead_markup
                     )
                 elif word.startswith("Fr="):
                     process_fingering(word, out)
-                elif re.match("letter[A-Z]$", word):
+                elif _PAT_LETTER.match(word):
                     # TODO: not compatible with key change at same point, at least not in lilypond 2.20 (2nd mark mentioned will be dropped)
                     out.append(r'\mark \markup { \box { "%s" } }' % word[-1])
-                elif re.match(r"R\*[1-9][0-9\/]*$", word):
+                elif _PAT_RMULT.match(word):
                     if not western:
                         # \compressFullBarRests on Lilypond 2.20, \compressEmptyMeasures on 2.22, both map to \set Score.skipBars
                         out.append(
                             r"\set Score.skipBars = ##t \override MultiMeasureRest #'expand-limit = #1 "
                         )
                     out.append(r"R" + notehead_markup.wholeBarRestLen() + word[1:])
-                elif re.match(
-                    "[1-9][0-9]*/[1-468]+(,[1-9][0-9]*[.]?)?$", word
-                ):  # time signature
+                elif _PAT_TIMESIG_WORD.match(word):  # time signature
                     process_time_signature(word, out, notehead_markup, midi)
-                elif word == "OnePage":
-                    if notehead_markup.onePage:
-                        sys.stderr.write(
-                            "WARNING: Duplicate OnePage, did you miss out a NextScore?\n"
-                        )
-                    notehead_markup.onePage = 1
-                elif word == "KeepOctave":
-                    pass  # undocumented option removed in 1.7, no effect
-                # TODO: document this.  If this is on, you have to use c in a note to go back to crotchets.
-                elif word == "KeepLength":
-                    notehead_markup.keepLength = 1
-                elif word == "NoBarNums":
-                    if notehead_markup.noBarNums:
-                        sys.stderr.write(
-                            "WARNING: Duplicate NoBarNums, did you miss out a NextScore?\n"
-                        )
-                    notehead_markup.noBarNums = 1
-                elif word == "SeparateTimesig":
-                    if notehead_markup.separateTimesig:
-                        sys.stderr.write(
-                            "WARNING: Duplicate SeparateTimesig, did you miss out a NextScore?\n"
-                        )
-                    notehead_markup.separateTimesig = 1
-                    out.append(r"\override Staff.TimeSignature #'stencil = ##f")
-                elif word in ["angka", "Indonesian"]:
-                    global not_angka
-                    if not_angka:
-                        sys.stderr.write(
-                            "WARNING: Duplicate angka, did you miss out a NextScore?\n"
-                        )
-                    not_angka = True
-                elif word == "WithStaff":
-                    pass
-                elif word == "PartMidi":
-                    pass  # handled in process_input
+                elif word in _WORD_HANDLERS:
+                    _WORD_HANDLERS[word](out)
                 elif word[0] == "R" and word[-1] == "{":  # word == "R{" or "R2{"
                     n = int(word[1:-1]) if len(word) > 2 else 2
                     repeatStack.append((1, 0, 0))
                     out.append(rf"\repeat volta {n} {{")
-                elif re.match("R[1-9][0-9]*{$", word):
+                elif _PAT_PERCENT_REPEAT.match(word):
                     times = int(word[1:-1])
                     repeatStack.append((1, notehead_markup.barPos, times - 1))
                     out.append(r"\repeat percent %d {" % times)
@@ -2708,22 +3185,20 @@ def getLY(score, headers=None, midi=True):
                         out[lastPtr] = out[lastPtr][:-1] + word + " }"
                     else:
                         out.append(word)
-                elif re.match(r"[1-9][0-9]*\[$", word):
+                elif _PAT_TUPLET.match(word):
                     # tuplet start, e.g. 3[
                     fitIn = int(word[:-1])
-                    i = 2
-                    while i < fitIn:
-                        i *= 2
+                    i = 1 << max(fitIn - 1, 0).bit_length()  # smallest power of 2 >= fitIn
                     if i == fitIn:
-                        num = int(fitIn * 3 / 2)
+                        num = fitIn * 3 // 2
                     else:
-                        num = int(i / 2)
+                        num = i >> 1
                     out.append("\\times %d/%d {" % (num, fitIn))
                     notehead_markup.tuplet = (num, fitIn)
                 elif word == "]":  # tuplet end
                     out.append("}")
                     notehead_markup.tuplet = (1, 1)
-                elif re.match(r"g\[[#b',1-9\s]+\]$", word):
+                elif _PAT_GRACE.match(word):
                     defined_jianpuGrace, afternext = process_grace_notes(
                         word,
                         out,
@@ -2733,7 +3208,7 @@ def getLY(score, headers=None, midi=True):
                         afternext,
                         defined_jianpuGrace,
                     )
-                elif re.match(r"\[[#b',1-9]+\]g$", word):
+                elif _PAT_GRACE_AFTER.match(word):
                     defined_JGR = process_grace_notes_after(
                         word, out, lastPtr, notehead_markup, midi, western, defined_JGR
                     )
@@ -2796,10 +3271,10 @@ def process_input(inDat, withStaff=False):
     - str - The LilyPond code corresponding to the input data.
     """
     global unicode_mode
-    unicode_mode = not not re.search(r"\sUnicode\s", " " + inDat + " ")
+    unicode_mode = not not _UNICODE_WORD_RE.search(" " + inDat + " ")
     if unicode_mode:
         return get_unicode_approx(
-            re.sub(r"\sUnicode\s", " ", " " + inDat + " ").strip()
+            _UNICODE_WORD_RE.sub(" ", " " + inDat + " ").strip()
         )
     ret = []
     global scoreNo, western, has_lyrics, midi, not_angka, maxBeams, uniqCount, notehead_markup
@@ -2808,24 +3283,31 @@ def process_input(inDat, withStaff=False):
     scoreNo = 0  # incr'd to 1 below
     western = False
     poet1st = not re.search(r"^\s*poet=[^\n]+填词", inDat, re.M)
-    hasarranger = re.search(r"^\s*arranger=", inDat, re.M)
 
-    for score in re.split(r"\sNextScore\s", " " + inDat + " "):
+    padded = " " + inDat + " "
+    scores = _NEXTSCORE_RE.split(padded) if "NextScore" in inDat else [padded]
+    for score in scores:
         if not score.strip():
             continue
         scoreNo += 1
         # The occasional false positive doesn't matter: has_lyrics==False is only an optimisation so we don't have to create use_rest_hack voices.  It is however important to always detect lyrics if they are present.
-        has_lyrics = not not re.search("(^|\n)[LH]:", score)
-        parts = [p for p in re.split(r"\sNextPart\s", " " + score + " ") if p.strip()]
+        has_lyrics = not not _LYRICS_TAG_RE.search(score)
+        padded_score = " " + score + " "
+        parts = (
+            [p for p in _NEXTPART_RE.split(padded_score) if p.strip()]
+            if "NextPart" in score
+            else [padded_score]
+        )
         for midi in [False, True]:
             not_angka = False  # may be set by getLY
             if scoreNo == 1 and not midi:
                 # now we've established non-empty
-                ret.append(all_scores_start(poet1st, hasarranger))
+                ret.append(all_scores_start(poet1st))
             # TODO: document this (results in 1st MIDI file containing all parts, then each MIDI file containing one part, if there's more than 1 part)
             separate_score_per_part = (
                 midi
-                and re.search(r"\sPartMidi\s", " " + score + " ")
+                and "PartMidi" in score
+                and _PARTMIDI_RE.search(padded_score)
                 and len(parts) > 1
             )
             for separate_scores in (
@@ -2848,22 +3330,18 @@ def process_input(inDat, withStaff=False):
                         inst = None
                     if midi:
                         ret.append(
-                            midi_staff_start() + " " + out + " " + midi_staff_end()
+                            f"{midi_staff_start()} {out} {midi_staff_end()}"
                         )
                     else:
                         staffStart, voiceName = jianpu_staff_start(
                             inst, notehead_markup.withStaff
                         )
-                        ret.append(staffStart + " " + out + " " + jianpu_staff_end())
+                        ret.append(f"{staffStart} {out} {jianpu_staff_end()}")
                         if notehead_markup.withStaff:
                             western = True
                             staffStart, voiceName = western_staff_start(inst)
                             ret.append(
-                                staffStart
-                                + " "
-                                + getLY(part)[0]
-                                + " "
-                                + western_staff_end()
+                                f"{staffStart} {getLY(part)[0]} {western_staff_end()}"
                             )
                             western = False
                         if lyrics:
@@ -2879,8 +3357,16 @@ def process_input(inDat, withStaff=False):
                             )
                     if partNo == len(parts) - 1 or separate_scores:
                         ret.append(score_end(**headers))
-    ret = "".join(r + "\n" for r in ret)
-    ret = re.sub(r'([\^_])"(\\[^"]+)"', r"\1\2", ret)
+    return _finalize_full_output("\n".join(ret) + "\n" if ret else "")
+
+
+def _finalize_full_output(ret):
+    """
+    Whole-document passes that can only run once every score section has
+    been assembled (annotation unquoting, the StaffGroup wrapper for
+    multi-staff pieces, and the LilyPond 2.24 override syntax fix).
+    """
+    ret = _ANNOT_CMD_RE.sub(r"\1\2", ret)
 
     # Add staff group if there are multiple sections starting with "BEGIN JIANPU STAFF".
     # If so, add "\new StaffGroup <<" after first occurance of "%% === BEGIN JIANPU STAFF ===".
@@ -2895,7 +3381,7 @@ def process_input(inDat, withStaff=False):
 
     if lilypond_minor_version() >= 24:
         # needed to avoid deprecation warnings on Lilypond 2.24
-        ret = re.sub(r"(\\override [A-Z][^ ]*) #'", r"\1.", ret)
+        ret = _OVERRIDE_DOT_RE.sub(r"\1.", ret)
     return ret
 
 
@@ -2909,9 +3395,9 @@ def get_unicode_approx(inDat):
     Returns:
         str: The Unicode approximation of the input data.
     """
-    if re.search(r"\sNextPart\s", " " + inDat + " "):
+    if _NEXTPART_RE.search(" " + inDat + " "):
         errExit("multiple parts in Unicode mode not yet supported")
-    if re.search(r"\sNextScore\s", " " + inDat + " "):
+    if _NEXTSCORE_RE.search(" " + inDat + " "):
         errExit("multiple scores in Unicode mode not yet supported")
     # TODO: also pick up on other not-supported stuff e.g. grace notes (or check for unicode_mode when these are encountered)
     global notehead_markup, western, midi, uniqCount, scoreNo, has_lyrics, not_angka, maxBeams
@@ -2980,9 +3466,9 @@ For Unicode approximation on this system, please do one of these things:
             else:
                 cwd = None
 
-            o = open(fn, "w")
-            fix_utf8(o, "w").write(outDat)
-            o.close()
+            # single bulk encode, bypassing the codecs stream-writer machinery
+            with open(fn, "wb") as o:
+                o.write(outDat.encode("utf-8"))
             pdf = fn[:-3] + ".pdf"
 
             try:
@@ -3006,7 +3492,39 @@ For Unicode approximation on this system, please do one of these things:
             if cwd:
                 os.chdir(cwd)
             return
-    fix_utf8(sys.stdout, "w").write(outDat)
+    sys.stdout.buffer.write(outDat.encode("utf-8"))
+
+
+# Patterns for reformat_key_time_signatures, compiled once
+_KEYSIG_MARKUP_RE = re.compile(r"\\markup\{\s*1=([A-G])(\\flat|\\sharp)?\}")
+# A whole jianpu staff section, both marker lines inclusive
+_JIANPU_STAFF_BLOCK_RE = re.compile(
+    r"\n%% === BEGIN JIANPU STAFF ===\n.*?\n% === END JIANPU STAFF ===\n", re.DOTALL
+)
+_JIANPU_SECTION_RE = re.compile(
+    r"%% === BEGIN JIANPU STAFF ===(.*?)% === END JIANPU STAFF ===", re.DOTALL
+)
+_TIME_FRACTION_RE = re.compile(r"\\time\s+(\d+)/(\d+)")
+_KEYSIG_MARK_RE = re.compile("\\\\mark \\\\markup\\{\\s*([16]=[\u266d\u266f]?[A-G])\\}")
+_STEM_KEYSIG_RE = re.compile(
+    "(\\\\override Staff\\.Stem\\.transparent = ##t\\s+)\\\\mark \\\\markup\\{[16]=[\u266d\u266f]?[A-G]\\}"
+)
+
+
+# Verbose-fraction replacement template for _TIME_FRACTION_RE
+_TIME_FRACTION_TEMPLATE = (
+    r"\\override Staff.TimeSignature.text = \\markup "
+    r"{ \\translate #'(0 . -0.5) \\bold \\fontsize #2 \\fraction \1 \2} \\time \1/\2"
+)
+
+
+def _replace_key_signature(match):
+    """Replacement for _KEYSIG_MARKUP_RE: use the Unicode accidental."""
+    note, alteration = match.group(1), match.group(2)
+    alteration_symbol = (
+        "\u266d" if alteration == "\\flat" else "\u266f" if alteration == "\\sharp" else ""
+    )
+    return f"\\markup{{1={alteration_symbol}{note}}}"
 
 
 def reformat_key_time_signatures(s, with_staff):
@@ -3024,30 +3542,17 @@ def reformat_key_time_signatures(s, with_staff):
     - str: Reformatted string with updated key and time signatures.
     """
 
-    # Pattern to capture key signature with optional flat or sharp
-    key_signature_pattern = re.compile(r"\\markup\{\s*1=([A-G])(\\flat|\\sharp)?\}")
-
-    # Function to replace key signature matches with correct formatting
-    def replace_key_signature(match):
-        note, alteration = match.group(1), match.group(2)
-        alteration_symbol = (
-            "♭" if alteration == "\\flat" else "♯" if alteration == "\\sharp" else ""
-        )
-        return f"\\markup{{1={alteration_symbol}{note}}}"
-
     # Apply replacement to key signatures
-    s = key_signature_pattern.sub(replace_key_signature, s)
+    s = _KEYSIG_MARKUP_RE.sub(_replace_key_signature, s)
 
     # Extract Jianpu staff notation section
-    jianpu_staff_section_match = re.search(
-        r"%% === BEGIN JIANPU STAFF ===(.*?)% === END JIANPU STAFF ===", s, re.DOTALL
-    )
+    jianpu_staff_section_match = _JIANPU_SECTION_RE.search(s)
 
     if jianpu_staff_section_match:
         jianpu_staff_section = jianpu_staff_section_match.group(1)
 
         # Find unique time signatures and maintain their order of occurrences
-        time_signatures = re.findall(r"\\time\s+(\d+)/(\d+)", jianpu_staff_section)
+        time_signatures = _TIME_FRACTION_RE.findall(jianpu_staff_section)
 
         # Remove duplicates while preserving order using dict.fromkeys()
         time_signatures_ordered = list(dict.fromkeys(time_signatures))
@@ -3061,8 +3566,8 @@ def reformat_key_time_signatures(s, with_staff):
         )
 
         # Update original string with sorted time signatures
-        keysig = re.search(r"\\mark \\markup\{\s*([16]=[♭♯]?[A-G])\}", s).group(1)
-        s = re.sub(r"(\\override Staff\.Stem\.transparent = ##t\s+)\\mark \\markup\{[16]=[♭♯]?[A-G]\}", r"\1", s)
+        keysig = _KEYSIG_MARK_RE.search(s).group(1)
+        s = _STEM_KEYSIG_RE.sub(r"\1", s)
         s = s.replace(
             'keytimesignature=""',
             r"keytimesignature=\markup{ \concat { "
@@ -3073,11 +3578,7 @@ def reformat_key_time_signatures(s, with_staff):
         )
 
         # Replace remaining time signatures using fractions
-        s = re.sub(
-            r"\\time\s+(\d+)/(\d+)",
-            r"\\override Staff.TimeSignature.text = \\markup { \\translate #'(0 . -0.5) \\bold \\fontsize #2 \\fraction \1 \2} \\time \1/\2",
-            s,
-        )
+        s = _TIME_FRACTION_RE.sub(_TIME_FRACTION_TEMPLATE, s)
 
     return s
 
@@ -3095,38 +3596,43 @@ def filter_out_jianpu(lilypond_text):
     str: The modified LilyPond text with all JIANPU sections removed
     """
 
-    begin_jianpu = "\n%% === BEGIN JIANPU STAFF ===\n"
-    end_jianpu = "\n% === END JIANPU STAFF ===\n"
-
-    while True:
-        start_index = lilypond_text.find(begin_jianpu)
-        end_index = lilypond_text.find(end_jianpu) + len(end_jianpu)
-
-        if start_index != -1 and end_index != -1:
-            # Remove the JIANPU section
-            lilypond_text = lilypond_text[:start_index] + lilypond_text[end_index:]
-        else:
-            # No more JIANPU sections exist, so break from the loop
-            break
-
-    return lilypond_text
+    return _JIANPU_STAFF_BLOCK_RE.sub("", lilypond_text)
 
 
 # Function to download plain text file from Google Drive
+@functools.lru_cache(maxsize=None)
 def download_file_from_google_drive(id):
     """
     This function downloads a Google Docs document as plain text using its file ID.
 
+    Each successful download is mirrored under ~/.cache/jianpu-ly/<id>; a
+    fresh download always wins (so edits to the document are never masked
+    by the cache), but repeated calls in one run reuse the lru_cache and
+    a failed download falls back to the last cached copy.
+
     :param id: The ID of the file to download from Google Drive
     :returns: The text content of the downloaded file
     """
+    # Deferred import: requests (and its urllib3/certifi dependencies) is
+    # only needed for Google Drive input, so keep it off the startup path
+    import requests
 
     # Construct the URL for downloading the document as plain text
     url = f"https://docs.google.com/document/export?format=txt&id={id}"
+    cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "jianpu-ly")
+    cache_path = os.path.join(cache_dir, id)
 
     # Send a GET request to the constructed URL
-    response = requests.get(url)
-    response.raise_for_status()
+    try:
+        response = requests.get(url)
+        response.raise_for_status()
+    except Exception:
+        if os.path.exists(cache_path):
+            sys.stderr.write(
+                "WARNING: Google Drive download failed, using cached copy\n"
+            )
+            return _read_utf8(cache_path)
+        raise
 
     # Decode the response content with UTF-8
     text = response.content.decode("utf-8")
@@ -3138,10 +3644,18 @@ def download_file_from_google_drive(id):
     # Replace CRLF with LF
     text = text.replace("\r\n", "\n")
 
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            f.write(text)
+    except OSError:
+        pass  # caching is best-effort only
+
     # Return the processed text
     return text
 
 
+@functools.lru_cache(maxsize=1)
 def parse_arguments():
     """
     Parse command line arguments.
@@ -3244,6 +3758,9 @@ def parse_arguments():
     return args
 
 
+_TITLE_LINE_RE = re.compile(".*title=.*")
+
+
 def get_title_from_text(input_text):
     """
     Extracts the title from a string of text that contains a line with 'title='.
@@ -3254,12 +3771,12 @@ def get_title_from_text(input_text):
     Returns:
         str or None: The extracted title as a string, or None if no title is found.
     """
-    # Find the line containing 'title=' and extract <title>
-    title_line = next(
-        (line for line in input_text.split("\n") if "title=" in line), None
-    )
+    # Find the first line containing 'title=' in one scan ('.' does not
+    # cross newlines), rather than materializing a list of every line
+    title_line = _TITLE_LINE_RE.search(input_text)
     if title_line:
-        title = title_line.split("=")[1].strip()  # Remove leading/trailing whitespaces
+        # Remove leading/trailing whitespaces
+        title = title_line.group(0).split("=")[1].strip()
         title = title.replace(" ", "_")  # Replace spaces with underscores
         return title
     return None  # Return None if no title is found
@@ -3311,24 +3828,89 @@ def convert_midi_to_mp3(base_name, with_metronome, normalize=True):
     command = None
 
     if with_metronome and shutil.which("mscore"):
-        command = f"mscore -o {base_name}.mp3 {base_name}.midi"
+        command = ["mscore", "-o", f"{base_name}.mp3", f"{base_name}.midi"]
     elif with_metronome and shutil.which("musescore"):
-        command = f"musescore -o {base_name}.mp3 {base_name}.midi"
-    else:
-        command = f"timidity {base_name}.midi -Ow -o - | lame - -b 192 {base_name}.mp3"
+        command = ["musescore", "-o", f"{base_name}.mp3", f"{base_name}.midi"]
 
-    process = subprocess.Popen(command, stdout=subprocess.PIPE, shell=True)
-    output, error = process.communicate()
+    if command:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE)
+        output, error = process.communicate()
 
-    if error:
-        print(f"Error: {error}")
-    else:
-        print(f"Output: {output}")
-
-    if normalize:
+        if error:
+            print(f"Error: {error}")
+        else:
+            print(f"Output: {output}")
+
+        if normalize:
+            normalize_volume(f"{base_name}.mp3")
+        return
+
+    # timidity path: render to WAV once, measure the peak on the raw PCM
+    # and let LAME apply the gain during its only encode, so the MP3
+    # never has to be decoded and re-encoded for normalization.  argv
+    # lists avoid a shell fork and any quoting issues in base_name.
+    fd, wav_filename = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    # Encode into a temp file in the target's directory and rename into
+    # place once LAME exits: the rename is atomic on the same filesystem,
+    # so a crash mid-encode never leaves a partial .mp3 at the final path
+    mp3_target = f"{base_name}.mp3"
+    fd, mp3_tmp = tempfile.mkstemp(
+        suffix=".mp3", dir=os.path.dirname(mp3_target) or "."
+    )
+    os.close(fd)
+    try:
+        subprocess.run(["timidity", f"{base_name}.midi", "-Ow", "-o", wav_filename])
+        scale = _wav_peak_scale(wav_filename) if normalize else None
+        scale_opt = ["--scale", f"{scale:.4f}"] if scale else []
+        # -q 5 relaxes the psychoacoustic search: much faster on
+        # synthesized timidity output with no audible difference at 192k
+        subprocess.run(
+            ["lame", "-q", "5"] + scale_opt + [wav_filename, "-b", "192", mp3_tmp]
+        )
+        os.replace(mp3_tmp, mp3_target)
+    finally:
+        os.remove(wav_filename)
+        if os.path.exists(mp3_tmp):
+            os.remove(mp3_tmp)
+
+    if normalize and scale is None:
+        # pydub unavailable: normalize the MP3 after the fact instead
         normalize_volume(f"{base_name}.mp3")
 
 
+@functools.lru_cache(maxsize=1)
+def _audio_segment():
+    """
+    pydub's AudioSegment class, imported once on first use (pydub stays
+    off the startup path for the common no-audio runs), or None if pydub
+    is not installed.
+    """
+    try:
+        from pydub import AudioSegment
+    except ImportError:
+        return None
+    return AudioSegment
+
+
+def _wav_peak_scale(wav_filename):
+    """
+    Returns the linear gain that brings the WAV file's peak to full scale,
+    or None if pydub is unavailable or the file is silent (callers then
+    fall back to normalize_volume / no scaling).
+    """
+    AudioSegment = _audio_segment()
+    if AudioSegment is None:
+        return None
+    audio = AudioSegment.from_file(wav_filename, format="wav")
+    if not audio.max:
+        return None
+    return audio.max_possible_amplitude / audio.max
+
+
+_MAX_VOLUME_RE = re.compile(r"max_volume:\s*(-?[0-9.]+)\s*dB")
+
+
 def normalize_volume(filename, inplace=True):
     """
     Normalizes the volume of an MP3 file.
@@ -3346,10 +3928,8 @@ def normalize_volume(filename, inplace=True):
     Returns:
         None: The function modifies the file directly and does not return anything.
     """
-    try:
-        # Try to import pydub and use it for normalization
-        from pydub import AudioSegment
-
+    AudioSegment = _audio_segment()  # imported once per process
+    if AudioSegment is not None:
         audio = AudioSegment.from_file(filename, format="mp3")
         change_in_dBFS = -audio.max_dBFS
         normalized_audio = audio.apply_gain(change_in_dBFS)
@@ -3358,31 +3938,61 @@ def normalize_volume(filename, inplace=True):
             filename = "normalized_" + filename
         normalized_audio.export(filename, format="mp3")
 
-    except ImportError:
-        # pydub is not available, use ffmpeg instead
-        cmd_detect_volume = f"ffmpeg -i {filename} -af volumedetect -f null /dev/null"
-        result = subprocess.run(
-            cmd_detect_volume, capture_output=True, text=True, shell=True
+    else:
+        # pydub is not available, use ffmpeg instead.  Peak normalization
+        # needs the whole file scanned before the gain is known, so two
+        # passes are unavoidable; but argv lists skip the shell and the
+        # stderr is scanned line by line for the one figure we need.
+        result = subprocess.Popen(
+            [
+                "ffmpeg",
+                "-nostdin",
+                "-i",
+                filename,
+                "-af",
+                "volumedetect",
+                "-f",
+                "null",
+                os.devnull,
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
         )
-        max_volume_line = [
-            line for line in result.stderr.split("\n") if "max_volume" in line
-        ]
-        if max_volume_line:
-            max_volume = max_volume_line[0].split(":")[1].strip().replace(" dB", "")
+        max_volume = None
+        for line in result.stderr:
+            m = _MAX_VOLUME_RE.search(line)
+            if m:
+                max_volume = m.group(1)
+        result.wait()
+        if max_volume is not None:
             volume_adjustment = str(-float(max_volume))
 
-            # Create a unique temporary file
-            with tempfile.NamedTemporaryFile(delete=True, suffix=".mp3") as temp_file:
+            # Create a unique temporary file.  delete=False keeps the name
+            # reserved until ffmpeg overwrites it (-y): the old
+            # delete=True dance removed the file on leaving the 'with',
+            # racing anything else that could claim the name.
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_file:
                 temp_filename = temp_file.name
 
-            cmd_normalize_volume = (
-                f"ffmpeg -i {filename} -af volume={volume_adjustment}dB {temp_filename}"
+            subprocess.run(
+                [
+                    "ffmpeg",
+                    "-nostdin",
+                    "-y",
+                    "-i",
+                    filename,
+                    "-af",
+                    f"volume={volume_adjustment}dB",
+                    temp_filename,
+                ]
             )
-            subprocess.run(cmd_normalize_volume, shell=True)
 
             # Move the temp file to overwrite the original file if inplace is True
             if inplace:
                 shutil.move(temp_filename, filename)
+            else:
+                os.unlink(temp_filename)
 
 
 def main():
@@ -3409,7 +4019,7 @@ def main():
     if args.staff_only:
         out = filter_out_jianpu(out)
 
-    if re.search(r"春\s*节\s*序\s*曲", out):
+    if _CHUNJIE_RE.search(out):
         print('WARNING: Fixing "春节序曲".')
         out = workaround_text(out)
 
@@ -3418,15 +4028,13 @@ def main():
         convert_midi_to_mp3(args.title, args.metronome)
 
 
-def workaround_text(original_text):
-    # Text to be replaced
-    old_text = """
+_CHUNJIE_RE = re.compile(r"春\s*节\s*序\s*曲")
+# Fixed-string fixes applied by workaround_text in one scan
+_WORKAROUND_SUBS = {
+    """
     #:line (#:bold "1")
     #:line (#:bold "3")
-"""
-
-    # New text to be inserted
-    new_text = """
+""": """
     #:line (
       #:combine
         (#:bold "1")
@@ -3434,13 +4042,15 @@ def workaround_text(original_text):
     )
     #:vspace 0.2
     #:line (#:bold "3")
-"""
+""",
+    "< c' e'' >": "< c'' e'' >",
+}
+_WORKAROUND_RE = re.compile("|".join(re.escape(k) for k in _WORKAROUND_SUBS))
 
-    # Replace the old text with the new text
-    modified_text = original_text.replace(old_text, new_text)
 
-    modified_text = modified_text.replace("< c' e'' >", "< c'' e'' >")
-    return modified_text
+def workaround_text(original_text):
+    # Apply both replacements in a single traversal
+    return _WORKAROUND_RE.sub(lambda m: _WORKAROUND_SUBS[m.group(0)], original_text)
 
 
 if __name__ == "__main__":